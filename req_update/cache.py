@@ -0,0 +1,212 @@
+from __future__ import annotations
+from collections import OrderedDict
+import hashlib
+import json
+import os
+from pathlib import Path
+import tempfile
+import threading
+import time
+from typing import Any, Optional
+from urllib.parse import urlparse
+
+
+# Seconds that a cached response stays fresh, keyed by host
+DEFAULT_TTLS = {
+    'hub.docker.com': 24 * 60 * 60,
+    'api.github.com': 60 * 60,
+}
+DEFAULT_TTL = 60 * 60
+# Seconds that a cached 404 stays fresh, keyed by host
+DEFAULT_NEGATIVE_TTLS = {
+    'hub.docker.com': 6 * 60 * 60,
+    'api.github.com': 10 * 60,
+}
+DEFAULT_NEGATIVE_TTL = 10 * 60
+DEFAULT_MAX_SIZE = 64 * 1024 * 1024
+# Fraction of max_size that eviction shrinks the cache to, so that the
+# directory is not scanned again on the next write
+EVICT_FRACTION = 0.9
+DEFAULT_MEMORY_SIZE = 32 * 1024 * 1024
+
+
+class DiskCache:
+    """
+    Persistent cache of json responses, stored as one file per key.
+    Entries expire based on a per-host TTL and the least recently used entries
+    are evicted when the cache directory grows past max_size bytes.
+    Keys that are known to be missing (404) are cached with a shorter TTL.
+    The total size is scanned once and then tracked as entries are written.
+    """
+
+    def __init__(
+        self,
+        directory: Path,
+        ttls: Optional[dict[str, int]] = None,
+        max_size: int = DEFAULT_MAX_SIZE,
+        negative_ttls: Optional[dict[str, int]] = None,
+    ) -> None:
+        self.directory = directory
+        self.ttls = dict(DEFAULT_TTLS)
+        if ttls:
+            self.ttls.update(ttls)
+        self.max_size = max_size
+        self.negative_ttls = dict(DEFAULT_NEGATIVE_TTLS)
+        if negative_ttls:
+            self.negative_ttls.update(negative_ttls)
+        self.lock = threading.Lock()
+        self.size = sum(size for _, size, _ in self._entries())
+
+    def ttl(self, key: str, missing: bool = False) -> int:
+        """Return the number of seconds an entry for a key stays fresh"""
+        host = urlparse(key).hostname or ''
+        if missing:
+            return self.negative_ttls.get(host, DEFAULT_NEGATIVE_TTL)
+        return self.ttls.get(host, DEFAULT_TTL)
+
+    def path(self, key: str) -> Path:
+        """Return the file that an entry for a key is stored in"""
+        digest = hashlib.sha256(key.encode('utf-8')).hexdigest()
+        return self.directory / ('%s.json' % digest)
+
+    def get(self, key: str) -> Optional[Any]:
+        """Return the cached value for a key, or None if missing or expired"""
+        entry = self.get_entry(key)
+        if entry is None or not self.is_fresh(entry):
+            return None
+        return entry.get('value')
+
+    def get_entry(self, key: str) -> Optional[dict[str, Any]]:
+        """
+        Return the full cached entry for a key, including expired entries so
+        that they can be revalidated.  Returns None if there is no entry.
+        """
+        path = self.path(key)
+        try:
+            with open(path, 'r') as handle:
+                entry = json.load(handle)
+        except (OSError, ValueError):
+            return None
+        if not isinstance(entry, dict) or entry.get('key') != key:
+            return None
+        try:
+            # Mark the entry as recently used for LRU eviction
+            os.utime(path)
+        except OSError:
+            pass
+        return entry
+
+    def is_fresh(self, entry: dict[str, Any]) -> bool:
+        """Return if an entry is still within its TTL"""
+        age = time.time() - entry.get('stored', 0)
+        ttl = self.ttl(entry.get('key', ''), bool(entry.get('missing')))
+        return bool(age <= ttl)
+
+    def set(
+        self,
+        key: str,
+        value: Any,
+        validators: Optional[dict[str, str]] = None,
+    ) -> None:
+        """
+        Store a value for a key, evicting old entries if necessary.
+        Validators are HTTP headers (ETag, Last-Modified) for revalidation.
+        """
+        entry = {
+            'key': key,
+            'stored': time.time(),
+            'value': value,
+            'validators': validators or {},
+        }
+        self._write(entry)
+
+    def set_missing(self, key: str) -> None:
+        """Store that a key is known to be missing"""
+        entry = {'key': key, 'stored': time.time(), 'missing': True}
+        self._write(entry)
+
+    def _write(self, entry: dict[str, Any]) -> None:
+        path = self.path(entry['key'])
+        try:
+            self.directory.mkdir(parents=True, exist_ok=True)
+            handle, temp_path = tempfile.mkstemp(dir=self.directory)
+            with os.fdopen(handle, 'w') as temp_file:
+                json.dump(entry, temp_file)
+            size = os.path.getsize(temp_path)
+            try:
+                replaced = path.stat().st_size
+            except OSError:
+                replaced = 0
+            os.replace(temp_path, path)
+        except OSError:
+            return
+        with self.lock:
+            self.size += size - replaced
+            over = self.size > self.max_size
+        if over:
+            self.evict()
+
+    def evict(self) -> None:
+        """
+        Remove least recently used entries until under a fraction of
+        max_size, rescanning the directory to correct the tracked size
+        """
+        entries = self._entries()
+        total = sum(entry[1] for entry in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_size * EVICT_FRACTION:
+                break
+            try:
+                path.unlink()
+            except OSError:
+                continue
+            total -= size
+        with self.lock:
+            self.size = total
+
+    def _entries(self) -> list[tuple[float, int, Path]]:
+        """Return the modification time, size and path of every entry"""
+        entries = []
+        for path in self.directory.glob('*.json'):
+            try:
+                stat = path.stat()
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+        return entries
+
+
+class MemoryCache:
+    """
+    In-memory LRU cache of json values with a budget on their total size.
+    Sizes are estimated from the length of each value's json encoding.
+    This is not thread-safe; callers are expected to hold a lock.
+    """
+
+    def __init__(self, max_size: int = DEFAULT_MEMORY_SIZE) -> None:
+        self.max_size = max_size
+        self.size = 0
+        self.entries: OrderedDict[str, tuple[Any, int]] = OrderedDict()
+
+    def __contains__(self, key: object) -> bool:
+        return key in self.entries
+
+    def __getitem__(self, key: str) -> Any:
+        value, _ = self.entries[key]
+        self.entries.move_to_end(key)
+        return value
+
+    def __setitem__(self, key: str, value: Any) -> None:
+        size = len(json.dumps(value))
+        if key in self.entries:
+            self.size -= self.entries.pop(key)[1]
+        if size > self.max_size:
+            return
+        self.entries[key] = (value, size)
+        self.size += size
+        while self.size > self.max_size:
+            _, (_, evicted_size) = self.entries.popitem(last=False)
+            self.size -= evicted_size
+
+    def __len__(self) -> int:
+        return len(self.entries)
@@ -1,8 +1,19 @@
 from __future__ import annotations
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 import re
 import subprocess
+import threading
+from typing import Callable, Optional
 
+from req_update.registry import (
+    DOCKER_HUB_REGISTRY,
+    DockerHub,
+    OCIRegistry,
+    TagIndex,
+    split_registry,
+    tag_name_filter,
+)
 from req_update.util import HTTPError, Updater, Util, IGNORE_UPDATE_COMMENT
 
 
@@ -10,12 +21,20 @@ class Docker(Updater):
     UPDATE_FILE = re.compile(r'(^|/)Dockerfile$')
     LINE_HEADERS = ['FROM']
     DEPENDENCY_VERSION_SEPARATOR = ':'
+    # Separator of a pinned manifest digest, or empty if not supported
+    DIGEST_SEPARATOR = '@'
+    # Registry that dependencies are resolved from
+    REGISTRY = 'docker.io'
 
     def __init__(self, util: Util) -> None:
         super().__init__(util)
-        # Cache of known versions for each dependency
-        # This is required because hub.docker.com's APIs are limited to 100 items
-        self.known_versions: dict[str, str] = {}
+        self.docker_hub = DockerHub(util)
+        # Clients for registries other than Docker Hub, keyed by host
+        self.oci_registries: dict[str, OCIRegistry] = {}
+        # Tag index for each (registry host, repository, name filter), or
+        # None if the tags could not be listed
+        self.tag_indexes: dict[tuple[str, str, str], Optional[TagIndex]] = {}
+        self.tag_indexes_lock = threading.Lock()
 
     def check_applicable(self) -> bool:
         return len(self.get_update_files()) > 0
@@ -36,6 +55,7 @@ class Docker(Updater):
         Return if updates were made
         """
         update_files = self.get_update_files()
+        self.prefetch_versions(update_files)
         updates = False
         for f in update_files:
             update = self.update_dependencies_file(f)
@@ -44,6 +64,10 @@ class Docker(Updater):
         return updates
 
     def update_dependencies_file(self, update_file: Path) -> bool:
+        """
+        Commit each updated image from buffers staged in the git index, then
+        write the updated file to the working tree once
+        """
         dockerfile_lines = self.read_update_file(update_file)
         updates = False
         for i in range(len(dockerfile_lines)):
@@ -54,52 +78,144 @@ class Docker(Updater):
             updates = True
             dockerfile_lines[i] = new_line
             self.commit_dockerfile(update_file, dockerfile_lines, dependency, version)
+        if updates and not self.util.dry_run:
+            with open(update_file, 'w') as handle:
+                handle.write('\n'.join(dockerfile_lines))
         return updates
 
+    def prefetch_versions(self, update_files: list[Path]) -> None:
+        """
+        Resolve updated versions for every image in the update files
+        concurrently so that updating each file only reads warm results
+        """
+        images: set[tuple[str, str]] = set()
+        pinned: set[tuple[str, str]] = set()
+        for update_file in update_files:
+            for line in self.read_update_file(update_file):
+                dependency, version, digest = self.parse_reference(line)
+                if dependency and version:
+                    images.add((dependency, version))
+                    if digest:
+                        pinned.add((dependency, version))
+        with ThreadPoolExecutor(max_workers=self.util.jobs) as executor:
+            list(executor.map(lambda image: self.resolve_version(*image), images))
+            # Digests are only needed for the new versions of pinned images
+            updates = {
+                (dependency, self.resolve_version(dependency, version))
+                for dependency, version in pinned
+            }
+            updates = {update for update in updates if update[1]}
+            list(executor.map(lambda image: self.resolve_digest(*image), updates))
+
     def read_update_file(self, update_file: Path) -> list[str]:
         with open(update_file, 'r') as handle:
             lines = handle.readlines()
         lines = [line.strip('\n') for line in lines]
         return lines
 
-    def attempt_update_image(self, line: str) -> tuple[str, str, str]:
+    def parse_image(self, line: str) -> tuple[str, str]:
+        """
+        Return the image and version referenced by a line.
+        The version is empty if the image is not pinned to a single version.
+        """
+        dependency, version, _ = self.parse_reference(line)
+        return dependency, version
+
+    def parse_reference(self, line: str) -> tuple[str, str, str]:
+        """
+        Return the image, version and manifest digest referenced by a line,
+        like "debian", "12" and "sha256:..." for "debian:12@sha256:...".
+        The digest is empty if the image is not pinned to a digest.
+        """
         if IGNORE_UPDATE_COMMENT in line:
-            return line, '', ''
+            return '', '', ''
         for line_header in self.LINE_HEADERS:
             if line.strip().startswith(line_header):
                 rest = line.strip()[len(line_header):].split()
                 base_image = rest[0] if rest else ''
                 break
         else:
-            return line, '', ''
-        if base_image.count(self.DEPENDENCY_VERSION_SEPARATOR) != 1:
-            return line, base_image, ''
-        dependency = base_image.split(self.DEPENDENCY_VERSION_SEPARATOR)[0]
-        version = base_image.split(self.DEPENDENCY_VERSION_SEPARATOR)[1]
-        new_version = self.find_updated_version(dependency, version)
-        if new_version:
-            line = line.replace(
-                self.DEPENDENCY_VERSION_SEPARATOR + version,
-                self.DEPENDENCY_VERSION_SEPARATOR + new_version,
-            )
+            return '', '', ''
+        digest = ''
+        if self.DIGEST_SEPARATOR:
+            base_image, _, digest = base_image.partition(self.DIGEST_SEPARATOR)
+        # The registry host can also contain the separator as a port
+        dependency, separator, version = base_image.rpartition(
+            self.DEPENDENCY_VERSION_SEPARATOR,
+        )
+        if not separator or '/' in version or '@' in dependency:
+            return base_image, '', digest
+        return dependency, version, digest
+
+    def attempt_update_image(self, line: str) -> tuple[str, str, str]:
+        dependency, version, digest = self.parse_reference(line)
+        if not dependency or not version:
+            return line, dependency, ''
+        new_version = self.resolve_version(dependency, version)
+        if not new_version:
+            return line, dependency, ''
+        old_reference = dependency + self.DEPENDENCY_VERSION_SEPARATOR + version
+        new_reference = dependency + self.DEPENDENCY_VERSION_SEPARATOR + new_version
+        if digest:
+            new_digest = self.resolve_digest(dependency, new_version)
+            if not new_digest:
+                self.util.warn(
+                    'Cannot find digest of %s%s%s'
+                    % (dependency, self.DEPENDENCY_VERSION_SEPARATOR, new_version),
+                )
+                return line, dependency, ''
+            old_reference += self.DIGEST_SEPARATOR + digest
+            new_reference += self.DIGEST_SEPARATOR + new_digest
+        line = line.replace(old_reference, new_reference)
         return line, dependency, new_version
 
+    def lookup_name(self, dependency: str) -> str:
+        """Return the name that the versions of a dependency are looked up by"""
+        return dependency
+
+    def resolve_version(self, dependency: str, version: str) -> str:
+        """
+        Return find_updated_version, only looking up each image once per run
+        even when it is referenced by different updaters
+        """
+        key = (self.REGISTRY, self.lookup_name(dependency), version)
+        with self.util.resolved_versions_lock:
+            if key in self.util.resolved_versions:
+                return self.util.resolved_versions[key]
+        new_version = self.find_updated_version(dependency, version)
+        with self.util.resolved_versions_lock:
+            self.util.resolved_versions[key] = new_version
+        return new_version
+
+    def resolve_digest(self, dependency: str, tag: str) -> str:
+        """
+        Return the manifest digest of an image's tag, or an empty string if
+        it cannot be found.  Each (image, tag) is only looked up once per run.
+        """
+        key = (dependency, tag)
+        with self.util.resolved_versions_lock:
+            if key in self.util.resolved_digests:
+                return self.util.resolved_digests[key]
+        registry_host, repository = split_registry(dependency)
+        registry = self.oci_registry(registry_host or DOCKER_HUB_REGISTRY)
+        try:
+            digest = registry.manifest_digest(repository, tag)
+        except (HTTPError, KeyError, ValueError) as e:
+            self.util.debug('Cannot find digest: %s' % e)
+            digest = ''
+        with self.util.resolved_versions_lock:
+            self.util.resolved_digests[key] = digest
+        return digest
+
     def find_updated_version(self, dependency: str, original_version: str) -> str:
         if original_version == 'latest':
             self.util.warn('Cannot update docker image when using "latest"')
             return ''
-        new_version = self.known_versions.get(dependency, '')
-        if not new_version:
-            if dependency.count('/') == 1:
-                namespace = dependency.split('/', maxsplit=1)[0]
-                dependency_name = dependency.split('/')[1]
-            else:
-                namespace = 'library'
-                dependency_name = dependency
-            new_version = self._check_new_versions(
-                namespace, dependency_name, original_version,
-            )
-            self.known_versions[dependency] = new_version
+        registry_host, repository = split_registry(dependency)
+        registry_host = self.lookup_registry(registry_host)
+        new_version = self._check_new_versions(
+            registry_host, repository, original_version,
+        )
         if new_version == original_version:
             self.util.debug(
                 'No updates found for %s at %s' %
@@ -114,26 +230,141 @@ class Docker(Updater):
             return new_version
 
     def _check_new_versions(
-        self, namespace: str, dependency_name: str, version: str,
+        self, registry_host: str, repository: str, version: str,
     ) -> str:
-        new_versions = self.util.generate_next_versions(version)
-        for new_version in new_versions:
-            # Both seem to work:
-            # https://registry.hub.docker.com/api/content/v1/repositories/public/library/debian/tags
-            # https://hub.docker.com/v2/repositories/library/debian/tags
-            # Documentation: https://docs.docker.com/reference/api/hub/latest/#tag/repositories/paths/
-            url = (
-                'https://hub.docker.com/'
-                'v2/repositories/%s/%s/tags/%s'
-                % (namespace, dependency_name, new_version)
+        if not self.util.generate_next_versions(version):
+            # Versions without numbers have nothing to search for
+            return version
+        index = self.get_tag_index(registry_host, repository, version)
+
+        def exists(tag: str) -> bool:
+            return self._tag_exists(registry_host, repository, tag, index)
+        if index is not None and index.complete:
+            return self.search_versions(version, lambda tags: list(map(exists, tags)))
+        # Tags have to be probed over the network, so probe them concurrently
+        with ThreadPoolExecutor(max_workers=self.util.jobs) as executor:
+            return self.search_versions(
+                version, lambda tags: list(executor.map(exists, tags)),
             )
-            try:
-                self.util.cached_request(url, {})
-            except HTTPError as e:
-                self.util.debug('Invalid version: %s' % e)
-                continue
-            return self._check_new_versions(namespace, dependency_name, new_version)
-        return version
+
+    def search_versions(
+        self, version: str, exists: Callable[[list[str]], list[bool]],
+    ) -> str:
+        """
+        Return the newest version reachable by repeatedly moving to the first
+        existing candidate from generate_next_versions.
+        All candidates of a level are checked in one batch, and runs of
+        increments to the last number are checked in doubling windows, so
+        that long runs take a logarithmic number of batches.
+        """
+        while True:
+            candidates = self.util.generate_next_versions(version)
+            found = exists(candidates)
+            hits = [c for c, f in zip(candidates, found, strict=True) if f]
+            if not hits:
+                return version
+            version = hits[0]
+            if version == candidates[0]:
+                version = self._gallop(version, exists)
+
+    def _gallop(
+        self, version: str, exists: Callable[[list[str]], list[bool]],
+    ) -> str:
+        """
+        Return the last version in the unbroken run of increments to the last
+        number of version
+        """
+        window = 1
+        while True:
+            window *= 2
+            run = []
+            candidate = version
+            for _ in range(window):
+                candidate = self.util.generate_next_versions(candidate)[0]
+                run.append(candidate)
+            for candidate, found in zip(run, exists(run), strict=True):
+                if not found:
+                    return version
+                version = candidate
+
+    def lookup_registry(self, registry_host: str) -> str:
+        """
+        Return the registry host to look up tags in.  Docker Hub images are
+        looked up with the registry API when Docker Hub's registry has a
+        mirror, since pull-through mirrors do not serve the hub.docker.com API.
+        """
+        if not registry_host and self.util.mirror_url(
+            'https://%s/v2/' % DOCKER_HUB_REGISTRY,
+        ):
+            return DOCKER_HUB_REGISTRY
+        return registry_host
+
+    def oci_registry(self, registry_host: str) -> OCIRegistry:
+        """Return the client for a registry other than Docker Hub"""
+        with self.tag_indexes_lock:
+            if registry_host not in self.oci_registries:
+                self.oci_registries[registry_host] = OCIRegistry(
+                    self.util, registry_host,
+                )
+            return self.oci_registries[registry_host]
+
+    def get_tag_index(
+        self, registry_host: str, repository: str, version: str,
+    ) -> Optional[TagIndex]:
+        """
+        Return an index of the repository's tags that can contain updates
+        for the version, or None if tags cannot be listed.
+        An empty registry host refers to Docker Hub.
+        """
+        name_filter = tag_name_filter(version)
+        key = (registry_host, repository, name_filter)
+        with self.tag_indexes_lock:
+            if key in self.tag_indexes:
+                return self.tag_indexes[key]
+        index: Optional[TagIndex]
+        try:
+            if registry_host:
+                index = self.oci_registry(registry_host).list_tags(
+                    repository, name_filter,
+                )
+            else:
+                namespace, name = repository.split('/', maxsplit=1)
+                index = self.docker_hub.list_tags(namespace, name, name_filter)
+        except (HTTPError, KeyError, TypeError, ValueError, AttributeError) as e:
+            self.util.debug('Cannot list tags: %s' % e)
+            index = None
+        with self.tag_indexes_lock:
+            self.tag_indexes[key] = index
+        return index
+
+    def _tag_exists(
+        self,
+        registry_host: str,
+        repository: str,
+        tag: str,
+        index: Optional[TagIndex],
+    ) -> bool:
+        if index is not None:
+            if tag in index:
+                return True
+            if index.complete:
+                return False
+        # Fall back to checking the tag directly
+        try:
+            if registry_host:
+                registry = self.oci_registry(registry_host)
+                url = registry.manifest_url(repository, tag)
+                exists = registry.tag_exists(repository, tag)
+            else:
+                namespace, name = repository.split('/', maxsplit=1)
+                url = self.docker_hub.tag_url(namespace, name, tag)
+                exists = self.util.check_exists(url, {})
+        except HTTPError as e:
+            self.util.debug('Cannot check version: %s' % e)
+            return False
+        if not exists:
+            self.util.debug('Invalid version: %s' % url)
+        return exists
 
     def commit_dockerfile(self,
         update_file: Path,
@@ -141,7 +372,8 @@ class Docker(Updater):
         dependency: str,
         version: str,
     ) -> None:
-        if not self.util.dry_run:
-            with open(update_file, 'w') as handle:
-                handle.write('\n'.join(dockerfile))
-        self.util.commit_dependency_update(self.language, dependency, version)
+        """Commit new contents of a file without writing the working tree"""
+        self.util.stage_file(update_file, '\n'.join(dockerfile))
+        self.util.commit_dependency_update(
+            self.language, dependency, version, staged=True,
+        )
@@ -1,46 +1,263 @@
 from __future__ import annotations
 
+from functools import partial
 import json
+from pathlib import Path
 import re
+import subprocess
+from typing import Any, Iterator
+from urllib.parse import quote, urlsplit
 
 from req_update.docker import Docker
-from req_update.util import HTTPError
+from req_update.util import GITHUB_TAGS_GIT, HTTPError, Util
 
 
 GITHUB_API_HEADERS = {
     'Accept': 'application/vnd.github+json',
     'X-GitHub-Api-Version': '2022-11-28',
 }
+GITHUB_TAGS_URL = (
+    r'^https://api\.github\.com/repos/[^/]+/[^/]+/git/(matching-)?refs/tags'
+)
+GITHUB_MATCHING_TAGS_URL = (
+    'https://api.github.com/repos/%s/git/matching-refs/tags/%s?per_page=100'
+)
+GITHUB_GRAPHQL_URL = 'https://api.github.com/graphql'
+GITHUB_GIT_URL = 'https://github.com/%s.git'
+# Key that remembers the tags of a repository with a prefix from any source
+GITHUB_TAGS_KEY = 'https://github.com/%s#tags/%s'
+# Repositories looked up per GraphQL query
+GRAPHQL_BATCH_SIZE = 25
+# Most recent tags fetched for each repository over GraphQL
+GRAPHQL_TAGS = 100
+GRAPHQL_REPOSITORY = (
+    'r%(i)d: repository(owner: $owner%(i)d, name: $name%(i)d) { '
+    'refs(refPrefix: "refs/tags/", first: %(tags)d, '
+    'orderBy: {field: TAG_COMMIT_DATE, direction: DESC}) { nodes { name } } }'
+)
+
+
+def tag_names(refs: Any) -> list[str]:
+    """Reduce a list of git refs from api.github.com to tag names"""
+    return [str(ref['ref']).removeprefix('refs/tags/') for ref in refs]
+
+
+def action_repository(dependency: str) -> str:
+    """
+    Return the owner/repo of an action, which can be in a sub-path of its
+    repository like github/codeql-action/init
+    """
+    return '/'.join(dependency.split('/')[:2])
+
+
+def tag_prefix(version: str) -> str:
+    """
+    Return the part of a version before its first number (e.g. "v" for
+    "v4.1"), which every newer version with the same structure starts with
+    """
+    return re.split(r'[0-9]', version, maxsplit=1)[0]
+
+
+def tags_query(repositories: list[str]) -> dict[str, Any]:
+    """
+    Return a GraphQL request for the most recent tags of several
+    owner/repo repositories, aliased as r0, r1, ...
+    """
+    variables: dict[str, str] = {}
+    parameters = []
+    fields = []
+    for i, repository in enumerate(repositories):
+        owner, name = repository.split('/', maxsplit=1)
+        variables['owner%d' % i] = owner
+        variables['name%d' % i] = name
+        parameters.append('$owner%d: String!, $name%d: String!' % (i, i))
+        fields.append(GRAPHQL_REPOSITORY % {'i': i, 'tags': GRAPHQL_TAGS})
+    query = 'query(%s) { %s }' % (', '.join(parameters), ' '.join(fields))
+    return {'query': query, 'variables': variables}
 
 
 class GithubWorkflow(Docker):
     UPDATE_FILE = re.compile(r'^\.github/workflows/.+\.ya?ml$')
     LINE_HEADERS = ['uses:', '- uses:']
     DEPENDENCY_VERSION_SEPARATOR = '@'
+    DIGEST_SEPARATOR = ''
+    REGISTRY = 'github.com'
+
+    def __init__(self, util: Util) -> None:
+        super().__init__(util)
+        # Only tag names are used, so avoid caching the full ref objects
+        self.util.register_projection(GITHUB_TAGS_URL, tag_names)
+        self.graphql_url = GITHUB_GRAPHQL_URL
+        # Git remote of an owner/repo, for listing tags with git ls-remote
+        self.git_url = GITHUB_GIT_URL
+
+    def parse_reference(self, line: str) -> tuple[str, str, str]:
+        dependency, version, digest = super().parse_reference(line)
+        if dependency.startswith(('./', 'docker://')):
+            # Local actions and docker images are not versioned by tags
+            return dependency, '', ''
+        return dependency, version, digest
+
+    def lookup_name(self, dependency: str) -> str:
+        return action_repository(dependency)
+
+    def prefetch_versions(self, update_files: list[Path]) -> None:
+        """
+        With GitHub tokens, fetch the tags of every action in a few batched
+        GraphQL queries before resolving versions
+        """
+        if self.graphql_enabled() and self.util.github_tags != GITHUB_TAGS_GIT:
+            dependencies = set()
+            for update_file in update_files:
+                for line in self.read_update_file(update_file):
+                    dependency, version = self.parse_image(line)
+                    if dependency and version:
+                        dependencies.add(action_repository(dependency))
+            self.prefetch_graphql_tags(sorted(dependencies))
+        super().prefetch_versions(update_files)
+
+    def graphql_enabled(self) -> bool:
+        """Return if there are tokens for the GraphQL API, which requires them"""
+        return urlsplit(self.graphql_url).hostname in self.util.token_pools
+
+    def prefetch_graphql_tags(self, dependencies: list[str]) -> None:
+        """Fetch and remember the recent tags of repositories over GraphQL"""
+        for start in range(0, len(dependencies), GRAPHQL_BATCH_SIZE):
+            batch = dependencies[start:start + GRAPHQL_BATCH_SIZE]
+            try:
+                tags = self.fetch_graphql_tags(batch)
+            except (HTTPError, ValueError, KeyError, TypeError) as e:
+                self.util.debug('Cannot query tags over GraphQL: %s' % e)
+                continue
+            for dependency, names in tags.items():
+                self.util.memoize(self.graphql_key(dependency), names.copy)
+
+    def fetch_graphql_tags(self, dependencies: list[str]) -> dict[str, list[str]]:
+        """
+        Return the recent tag names of repositories from one GraphQL query.
+        Repositories that cannot be found are left out.
+        Raises HTTPError, or ValueError/KeyError/TypeError for malformed
+        responses.
+        """
+        headers = {'Content-Type': 'application/json'}
+        body = json.dumps(tags_query(dependencies)).encode('utf-8')
+        self.util.debug('Querying tags of %d actions' % len(dependencies))
+        response = self.util.send_request('POST', self.graphql_url, headers, body)
+        if int(response.status/100) != 2:
+            raise HTTPError(
+                self.graphql_url,
+                response.status,
+                response.reason,
+                response.headers,
+                None,
+            )
+        result = json.loads(response.body)
+        data = result.get('data') if isinstance(result, dict) else None
+        if not isinstance(data, dict):
+            # Errors like timeouts replace the whole response; missing
+            # repositories only null their own alias
+            errors = result.get('errors') if isinstance(result, dict) else None
+            raise ValueError('GraphQL query failed: %s' % errors)
+        tags = {}
+        for i, dependency in enumerate(dependencies):
+            repository = data.get('r%d' % i)
+            if repository is None:
+                continue
+            nodes = repository['refs']['nodes'] if repository['refs'] else []
+            tags[dependency] = [str(node['name']) for node in nodes]
+        return tags
+
+    def graphql_key(self, dependency: str) -> str:
+        """Return the key that remembers the GraphQL tags of a repository"""
+        return '%s#tags/%s' % (self.graphql_url, dependency)
+
+    def git_tags(self, dependency: str) -> list[str]:
+        """
+        Return the tag names of a repository from git ls-remote, which does
+        not use API quota.  Raises HTTPError with code 0 if git fails.
+        """
+        url = self.git_url % dependency
+
+        def fetch() -> list[str]:
+            command = ['git', 'ls-remote', '--tags', '--refs', url]
+            try:
+                result = self.util.execute_shell(
+                    command,
+                    True,
+                    suppress_output=True,
+                    # Fail instead of asking for credentials for missing repos
+                    env={'GIT_TERMINAL_PROMPT': '0'},
+                )
+            except subprocess.CalledProcessError as error:
+                raise HTTPError(url, 0, error.stderr.strip(), None, None) from error
+            return [
+                line.split('\t')[1].removeprefix('refs/tags/')
+                for line in result.stdout.splitlines()
+                if '\t' in line
+            ]
+        return list(self.util.memoize(url + '#tags', fetch))
+
+    def tag_pages(self, dependency: str, original_version: str) -> Iterator[Any]:
+        """
+        Yield lists of tag names that can contain updates.  Tags are
+        remembered under one key per repository and tag prefix whichever
+        source they came from, so that snapshots exported with one source
+        can be replayed by runners that would use another.
+        """
+        prefix = tag_prefix(original_version)
+        yield self.util.memoize(
+            GITHUB_TAGS_KEY % (dependency, prefix),
+            partial(self.fetch_tags, dependency, prefix),
+        )
+
+    def fetch_tags(self, dependency: str, prefix: str) -> list[str]:
+        """
+        Return the tag names of a repository that start with prefix, from git
+        ls-remote if configured, from GraphQL if there are GitHub tokens and
+        otherwise from the REST API
+        """
+        if self.util.github_tags == GITHUB_TAGS_GIT:
+            tags = self.git_tags(dependency)
+            return [tag for tag in tags if tag.startswith(prefix)]
+        if self.graphql_enabled():
+            def fetch() -> list[str]:
+                tags = self.fetch_graphql_tags([dependency])
+                if dependency not in tags:
+                    raise HTTPError(
+                        self.graphql_url, 404, 'Repository not found', None, None,
+                    )
+                return tags[dependency]
+            try:
+                tags = self.util.memoize(self.graphql_key(dependency), fetch)
+                return [tag for tag in tags if tag.startswith(prefix)]
+            except (HTTPError, ValueError, KeyError, TypeError) as e:
+                self.util.debug('Cannot query tags over GraphQL: %s' % e)
+        url = GITHUB_MATCHING_TAGS_URL % (dependency, quote(prefix))
+        tags = []
+        for page in self.util.cached_pages(url, GITHUB_API_HEADERS):
+            if not isinstance(page, list):
+                raise TypeError('Malformed page of tags from %s' % url)
+            tags.extend(page)
+        return tags
 
     def find_updated_version(self, dependency: str, original_version: str) -> str:
-        url = 'https://api.github.com/repos/%s/git/refs/tags' % dependency
         self.util.debug('Checking github tags for %s' % dependency)
+        repository = action_repository(dependency)
+        most_recent = original_version
         try:
-            tags = self.util.cached_request(url, GITHUB_API_HEADERS)
+            for versions in self.tag_pages(repository, original_version):
+                if not isinstance(versions, list):
+                    self.util.warn('Cannot parse tags for %s' % dependency)
+                    return ''
+                for version in versions:
+                    if self.util.compare_versions(most_recent, version):
+                        most_recent = version
         except (HTTPError, json.JSONDecodeError) as e:
-            self.util.warn(
-                'Cannot read %s from api.github.com: %s' % (dependency, str(e)),
-            )
+            self.util.warn('Cannot read tags for %s: %s' % (dependency, str(e)))
             return ''
-
-        try:
-            available_versions = [tag['ref'].removeprefix('refs/tags/') for tag in tags]
         except (TypeError, KeyError) as e:
-            self.util.warn(
-                'Cannot parse tags for %s from api.github.com: %s' %
-                    (dependency, str(e)),
-            )
+            self.util.warn('Cannot parse tags for %s: %s' % (dependency, str(e)))
             return ''
-        most_recent = original_version
-        for version in available_versions:
-            if self.util.compare_versions(most_recent, version):
-                most_recent = version
         if most_recent != original_version:
             self.util.debug(
                 'Found update for %s from %s to %s' %
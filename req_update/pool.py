@@ -0,0 +1,339 @@
+from __future__ import annotations
+import gzip
+import http.client
+import ssl
+import threading
+import time
+from typing import Optional
+import zlib
+from urllib.parse import urljoin, urlsplit
+from urllib.request import getproxies, proxy_bypass
+
+
+DEFAULT_MAX_PER_HOST = 8
+DEFAULT_CONNECT_TIMEOUT = 10.0
+DEFAULT_READ_TIMEOUT = 30.0
+# Responses slower than this many seconds reduce a host's concurrency
+SLOW_RESPONSE = 5.0
+# Consecutive failures before requests to a host fail fast
+BREAKER_THRESHOLD = 5
+BREAKER_COOLDOWN = 60.0
+MAX_REDIRECTS = 5
+REDIRECT_CODES = {301, 302, 303, 307, 308}
+ACCEPT_ENCODING = 'gzip, deflate'
+HostKey = tuple[str, str, int]
+
+
+class Response:
+    """A fully read HTTP response"""
+
+    def __init__(
+        self,
+        status: int,
+        reason: str,
+        headers: dict[str, str],
+        body: bytes,
+        wire_size: Optional[int] = None,
+    ) -> None:
+        self.status = status
+        self.reason = reason
+        # Header names are lowercased for case insensitive lookups
+        self.headers = {k.lower(): v for k, v in headers.items()}
+        self.body = body
+        # Number of body bytes transferred before decompression
+        self.wire_size = len(body) if wire_size is None else wire_size
+
+
+class CircuitOpenError(ConnectionError):
+    """Raised instead of sending requests to a host that keeps failing"""
+
+
+class HostState:
+    """
+    Adaptive concurrency limit and circuit breaker for one host.
+    The limit grows additively while responses are fast and successful and
+    is halved on slow or failed responses.  After BREAKER_THRESHOLD
+    consecutive failures, requests fail fast for BREAKER_COOLDOWN seconds.
+    """
+
+    def __init__(self, max_limit: int) -> None:
+        self.max_limit = max_limit
+        self.limit = float(max_limit)
+        self.in_flight = 0
+        self.failures = 0
+        self.open_until = 0.0
+        self.condition = threading.Condition()
+
+    def acquire(self) -> None:
+        """Wait for a free slot, or raise CircuitOpenError"""
+        with self.condition:
+            while True:
+                if time.monotonic() < self.open_until:
+                    raise CircuitOpenError('Circuit open after repeated failures')
+                if self.in_flight < int(self.limit):
+                    break
+                self.condition.wait()
+            self.in_flight += 1
+
+    def release(self, success: bool, latency: float) -> None:
+        """Free a slot and adjust the limit based on how the request went"""
+        with self.condition:
+            self.in_flight -= 1
+            if success:
+                self.failures = 0
+            else:
+                self.failures += 1
+            if success and latency <= SLOW_RESPONSE:
+                self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+            else:
+                self.limit = max(1.0, self.limit / 2)
+            if self.failures >= BREAKER_THRESHOLD:
+                self.open_until = time.monotonic() + BREAKER_COOLDOWN
+                # Reopen on the first failure after the cooldown
+                self.failures = BREAKER_THRESHOLD - 1
+            self.condition.notify_all()
+
+
+class ConnectionPool:
+    """
+    Thread-safe pool of persistent HTTP connections, keyed by host.
+    HTTPS connections share one SSLContext and resume TLS sessions.
+    Concurrent connections to each host are adaptively limited and hosts that
+    keep failing are short circuited; see HostState.
+    Responses are requested with gzip/deflate compression and decoded.
+    """
+
+    def __init__(
+        self,
+        max_per_host: int = DEFAULT_MAX_PER_HOST,
+        connect_timeout: float = DEFAULT_CONNECT_TIMEOUT,
+        read_timeout: float = DEFAULT_READ_TIMEOUT,
+    ) -> None:
+        self.max_per_host = max_per_host
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.context = ssl.create_default_context()
+        self.lock = threading.Lock()
+        self.idle: dict[HostKey, list[http.client.HTTPConnection]] = {}
+        self.hosts: dict[HostKey, HostState] = {}
+        self.tls_sessions: dict[str, ssl.SSLSession] = {}
+        self.connections_opened = 0
+
+    def request(
+        self,
+        method: str,
+        url: str,
+        headers: dict[str, str],
+        body: Optional[bytes] = None,
+    ) -> Response:
+        """Make an HTTP request, following redirects"""
+        headers = dict(headers)
+        headers.setdefault('Accept-Encoding', ACCEPT_ENCODING)
+        for _ in range(MAX_REDIRECTS):
+            response = self._request_once(method, url, headers, body)
+            location = response.headers.get('location')
+            if response.status not in REDIRECT_CODES or not location:
+                return response
+            redirect_url = urljoin(url, location)
+            if urlsplit(redirect_url).netloc != urlsplit(url).netloc:
+                # Do not send credentials to other hosts
+                headers = {
+                    name: value for name, value in headers.items()
+                    if name.lower() != 'authorization'
+                }
+            url = redirect_url
+            if response.status == 303:
+                method = 'GET'
+                body = None
+        return response
+
+    def _request_once(
+        self,
+        method: str,
+        url: str,
+        headers: dict[str, str],
+        body: Optional[bytes] = None,
+    ) -> Response:
+        parsed = urlsplit(url)
+        scheme = parsed.scheme or 'https'
+        host = parsed.hostname or ''
+        port = parsed.port or (443 if scheme == 'https' else 80)
+        key = (scheme, host, port)
+        path = parsed.path or '/'
+        if parsed.query:
+            path += '?' + parsed.query
+        host_state = self._host_state(key)
+        host_state.acquire()
+        start = time.monotonic()
+        success = False
+        try:
+            connection, reused = self._checkout(key)
+            if self._proxied(connection):
+                # Plain HTTP proxies need the absolute URL
+                path = url
+            try:
+                response, content = self._send(
+                    connection, method, path, headers, body,
+                )
+            except (http.client.HTTPException, OSError):
+                connection.close()
+                if not reused:
+                    raise
+                # The server closed an idle connection; retry on a new one
+                connection = self._new_connection(key)
+                try:
+                    response, content = self._send(
+                        connection, method, path, headers, body,
+                    )
+                except (http.client.HTTPException, OSError):
+                    connection.close()
+                    raise
+            if response.will_close:
+                connection.close()
+            else:
+                self._checkin(key, connection)
+            success = response.status < 500 and response.status != 429
+        finally:
+            host_state.release(success, time.monotonic() - start)
+        encoding = response.getheader('Content-Encoding', '')
+        return Response(
+            response.status,
+            response.reason,
+            dict(response.getheaders()),
+            decode_body(content, encoding),
+            len(content),
+        )
+
+    def _send(
+        self,
+        connection: http.client.HTTPConnection,
+        method: str,
+        path: str,
+        headers: dict[str, str],
+        body: Optional[bytes],
+    ) -> tuple[http.client.HTTPResponse, bytes]:
+        connection.request(method, path, body=body, headers=headers)
+        response = connection.getresponse()
+        # The whole body must be read before the connection can be reused
+        content = response.read()
+        return response, content
+
+    def _host_state(self, key: HostKey) -> HostState:
+        with self.lock:
+            if key not in self.hosts:
+                self.hosts[key] = HostState(self.max_per_host)
+            return self.hosts[key]
+
+    def _checkout(self, key: HostKey) -> tuple[http.client.HTTPConnection, bool]:
+        """Return an idle connection for a host, or a new connection"""
+        with self.lock:
+            idle = self.idle.get(key)
+            if idle:
+                return idle.pop(), True
+        return self._new_connection(key), False
+
+    def _checkin(
+        self, key: HostKey, connection: http.client.HTTPConnection,
+    ) -> None:
+        with self.lock:
+            self.idle.setdefault(key, []).append(connection)
+
+    def _new_connection(self, key: HostKey) -> http.client.HTTPConnection:
+        scheme, host, port = key
+        with self.lock:
+            self.connections_opened += 1
+        proxy = None
+        if not proxy_bypass(host):
+            proxy = getproxies().get(scheme)
+        connection: http.client.HTTPConnection
+        if scheme == 'https':
+            connection = _HTTPSConnection(self, host, port)
+            if proxy:
+                proxy_url = urlsplit(proxy)
+                connection.host = proxy_url.hostname or ''
+                connection.port = proxy_url.port or 80
+                connection.set_tunnel(host, port)
+        else:
+            connection = _HTTPConnection(self, host, port)
+            if proxy:
+                proxy_url = urlsplit(proxy)
+                connection.host = proxy_url.hostname or ''
+                connection.port = proxy_url.port or 80
+                setattr(connection, 'proxied', True)
+        return connection
+
+    @staticmethod
+    def _proxied(connection: http.client.HTTPConnection) -> bool:
+        return bool(getattr(connection, 'proxied', False))
+
+    def close(self) -> None:
+        """Close all idle connections"""
+        with self.lock:
+            for connections in self.idle.values():
+                for connection in connections:
+                    connection.close()
+            self.idle = {}
+
+
+def decode_body(body: bytes, encoding: str) -> bytes:
+    """Decompress a response body based on its Content-Encoding"""
+    encoding = encoding.strip().lower()
+    if not body or encoding in ('', 'identity'):
+        return body
+    try:
+        if encoding in ('gzip', 'x-gzip'):
+            return gzip.decompress(body)
+        if encoding == 'deflate':
+            try:
+                return zlib.decompress(body)
+            except zlib.error:
+                # Some servers send raw deflate data without a zlib header
+                return zlib.decompress(body, -zlib.MAX_WBITS)
+    except (OSError, EOFError, zlib.error) as error:
+        raise http.client.HTTPException(
+            'Cannot decode %s response: %s' % (encoding, error),
+        ) from error
+    raise http.client.HTTPException('Unsupported encoding %s' % encoding)
+
+
+class _HTTPConnection(http.client.HTTPConnection):
+    """HTTP connection with separate connect and read timeouts"""
+
+    def __init__(self, pool: ConnectionPool, host: str, port: int) -> None:
+        super().__init__(host, port, timeout=pool.connect_timeout)
+        self.pool = pool
+
+    def connect(self) -> None:
+        super().connect()
+        self.sock.settimeout(self.pool.read_timeout)
+
+
+class _HTTPSConnection(http.client.HTTPSConnection):
+    """
+    HTTPS connection with separate connect and read timeouts that resumes
+    TLS sessions from earlier connections
+    """
+
+    def __init__(self, pool: ConnectionPool, host: str, port: int) -> None:
+        super().__init__(
+            host, port, timeout=pool.connect_timeout, context=pool.context,
+        )
+        self.pool = pool
+        self.server_hostname = host
+
+    def connect(self) -> None:
+        # Open the TCP connection (and proxy tunnel) without TLS
+        http.client.HTTPConnection.connect(self)
+        session: Optional[ssl.SSLSession] = self.pool.tls_sessions.get(
+            self.server_hostname,
+        )
+        sock = self.pool.context.wrap_socket(
+            self.sock,
+            server_hostname=self.server_hostname,
+            session=session,
+        )
+        sock.settimeout(self.pool.read_timeout)
+        self.sock = sock
+        if sock.session is not None:
+            with self.pool.lock:
+                self.pool.tls_sessions[self.server_hostname] = sock.session
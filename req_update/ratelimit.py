@@ -0,0 +1,236 @@
+from __future__ import annotations
+import threading
+import time
+from typing import Callable, Optional
+from urllib.parse import urlsplit
+
+
+# Longest time worth waiting for a rate limit to reset instead of failing
+DEFAULT_MAX_WAIT = 60.0
+# Start spacing requests out once this fraction of the quota is left
+PACE_FRACTION = 0.1
+RATE_LIMITED_CODES = {403, 429}
+# GitHub quotas that are counted separately (X-RateLimit-Resource)
+CORE_RESOURCE = 'core'
+GRAPHQL_RESOURCE = 'graphql'
+
+
+def parse_quota(value: Optional[str]) -> Optional[int]:
+    """Parse a rate limit header like "76" or Docker Hub's "76;w=21600" """
+    if not value:
+        return None
+    try:
+        return int(value.split(';')[0].strip())
+    except ValueError:
+        return None
+
+
+def rate_limit_resource(url: str) -> str:
+    """Return the GitHub quota that a request to a URL counts against"""
+    if urlsplit(url).path.rstrip('/').endswith('/graphql'):
+        return GRAPHQL_RESOURCE
+    return CORE_RESOURCE
+
+
+class HostQuota:
+    """Token bucket of the requests remaining for a host until a reset"""
+
+    def __init__(self) -> None:
+        self.limit: Optional[int] = None
+        self.remaining: Optional[int] = None
+        self.reset: Optional[float] = None
+        self.next_request = 0.0
+
+    def reserve(self, now: float, max_wait: float) -> Optional[float]:
+        """
+        Take a token and return the seconds to wait before using it, or
+        return None without taking one if the wait would exceed max_wait
+        """
+        if self.reset is not None and now >= self.reset:
+            # The bucket has been refilled; wait for new headers
+            self.remaining = None
+            self.reset = None
+        if self.remaining is None:
+            return 0.0
+        if self.remaining <= 0:
+            delay = self.reset - now if self.reset is not None else 0.0
+            return delay if delay <= max_wait else None
+        interval = 0.0
+        if self.limit and self.reset is not None and (
+            self.remaining < self.limit * PACE_FRACTION
+        ):
+            # Spread the remaining tokens evenly until the reset
+            interval = (self.reset - now) / self.remaining
+        start = max(now, self.next_request)
+        if start - now > max_wait:
+            return None
+        self.next_request = start + interval
+        self.remaining -= 1
+        return start - now
+
+
+class RateLimitError(RuntimeError):
+    """Raised instead of sending a request that would wait too long for quota"""
+
+    def __init__(self, host: str) -> None:
+        super().__init__('Rate limit for %s exhausted' % host)
+        self.host = host
+
+
+class RateLimiter:
+    """
+    Paces requests to each host based on rate limit headers from GitHub
+    (X-RateLimit-*) and Docker Hub (RateLimit-*), waiting for a reset when
+    that is shorter than max_wait and failing fast otherwise.
+    """
+
+    def __init__(
+        self,
+        max_wait: float = DEFAULT_MAX_WAIT,
+        clock: Callable[[], float] = time.time,
+        sleep: Callable[[float], None] = time.sleep,
+    ) -> None:
+        self.max_wait = max_wait
+        self.clock = clock
+        self.sleep = sleep
+        self.lock = threading.Lock()
+        self.quotas: dict[str, HostQuota] = {}
+
+    def acquire(self, host: str) -> None:
+        """
+        Wait until a request to a host fits in its known quota.
+        Raises RateLimitError if that would take longer than max_wait.
+        """
+        with self.lock:
+            quota = self.quotas.get(host)
+            if quota is None:
+                return
+            delay = quota.reserve(self.clock(), self.max_wait)
+        if delay is None:
+            raise RateLimitError(host)
+        if delay > 0:
+            self.sleep(delay)
+
+    def update(self, host: str, headers: dict[str, str]) -> None:
+        """Record the quota reported in response headers"""
+        now = self.clock()
+        remaining = parse_quota(
+            headers.get('x-ratelimit-remaining', headers.get('ratelimit-remaining')),
+        )
+        retry_after = parse_quota(headers.get('retry-after'))
+        if remaining is None and retry_after is None:
+            return
+        with self.lock:
+            quota = self.quotas.setdefault(host, HostQuota())
+            limit = parse_quota(
+                headers.get('x-ratelimit-limit', headers.get('ratelimit-limit')),
+            )
+            if limit is not None:
+                quota.limit = limit
+            if remaining is not None:
+                quota.remaining = remaining
+            reset = parse_quota(headers.get('x-ratelimit-reset'))
+            if reset is not None:
+                quota.reset = float(reset)
+            if retry_after is not None:
+                quota.remaining = 0
+                quota.reset = now + retry_after
+
+    def remaining(self, host: str) -> Optional[int]:
+        """Return the requests remaining for a host, or None if unknown"""
+        with self.lock:
+            quota = self.quotas.get(host)
+            if quota is None:
+                return None
+            if quota.reset is not None and self.clock() >= quota.reset:
+                return None
+            return quota.remaining
+
+    def limited(self, host: str, status: int) -> bool:
+        """Return if a response was rejected because the quota ran out"""
+        return status in RATE_LIMITED_CODES and self.remaining(host) == 0
+
+    def retry_delay(self, host: str, status: int) -> Optional[float]:
+        """
+        Return the seconds to wait before retrying a rate limited response,
+        or None if the request should not be retried
+        """
+        if status not in RATE_LIMITED_CODES:
+            return None
+        with self.lock:
+            quota = self.quotas.get(host)
+            if quota is None or quota.remaining != 0 or quota.reset is None:
+                return None
+            delay = max(quota.reset - self.clock(), 0.0)
+        if delay > self.max_wait:
+            return None
+        return delay
+
+    def report(self) -> list[str]:
+        """Return a description of the remaining quota for each host"""
+        lines = []
+        with self.lock:
+            for host, quota in sorted(self.quotas.items()):
+                line = '%s: %s of %s requests remaining' % (
+                    host,
+                    '?' if quota.remaining is None else quota.remaining,
+                    '?' if quota.limit is None else quota.limit,
+                )
+                if quota.reset is not None:
+                    line += ', resets at %s' % time.strftime(
+                        '%H:%M:%S', time.localtime(quota.reset),
+                    )
+                lines.append(line)
+        return lines
+
+
+class TokenPool:
+    """
+    Tokens for one host that requests are rotated across, preferring the
+    token with the most remaining quota.  Each token's quotas are tracked by
+    the rate limiter under keys that number the token instead of including
+    it, so that tokens are never logged, with one key per resource.
+    """
+
+    def __init__(
+        self, host: str, tokens: list[str], rate_limiter: RateLimiter,
+    ) -> None:
+        self.host = host
+        self.tokens = list(tokens)
+        self.rate_limiter = rate_limiter
+        self.lock = threading.Lock()
+        self.requests = [0] * len(self.tokens)
+
+    def name(self, index: int) -> str:
+        """Return a description of a token that does not include it"""
+        return '%s token %d' % (self.host, index + 1)
+
+    def key(self, index: int, resource: str = CORE_RESOURCE) -> str:
+        """Return the rate limiter key of a token's quota for a resource"""
+        return '%s (%s)' % (self.name(index), resource)
+
+    def choose(self, resource: str = CORE_RESOURCE) -> tuple[str, str]:
+        """Pick a token for a request and return it with its rate limiter key"""
+        with self.lock:
+            def priority(index: int) -> tuple[bool, int, int]:
+                remaining = self.rate_limiter.remaining(self.key(index, resource))
+                # Tokens without a known quota are unused or have been reset
+                return (remaining is None, remaining or 0, -self.requests[index])
+            index = max(range(len(self.tokens)), key=priority)
+            self.requests[index] += 1
+        return self.tokens[index], self.key(index, resource)
+
+    def available(self, resource: str = CORE_RESOURCE) -> bool:
+        """Return if any token might still have quota left for a resource"""
+        return any(
+            self.rate_limiter.remaining(self.key(index, resource)) != 0
+            for index in range(len(self.tokens))
+        )
+
+    def report(self) -> list[str]:
+        """Return a description of the requests sent with each token"""
+        with self.lock:
+            return [
+                '%s: %d requests' % (self.name(index), requests)
+                for index, requests in enumerate(self.requests)
+            ]
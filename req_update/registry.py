@@ -0,0 +1,325 @@
+from __future__ import annotations
+import bisect
+import json
+import re
+from typing import Any, Iterable, Optional
+from urllib.parse import urlencode, urljoin
+
+from req_update.pool import Response
+from req_update.util import HTTPError, Util, next_link
+
+
+DOCKER_HUB_TAGS_URL = 'https://hub.docker.com/v2/repositories/%s/%s/tags'
+DOCKER_HUB_TAG_PAGES = (
+    r'^https://hub\.docker\.com/v2/repositories/[^/]+/[^/]+/tags\?'
+)
+PAGE_SIZE = 100
+# Stop listing tags after this many pages and fall back to probing
+MAX_TAG_PAGES = 10
+# Hosts that refer to Docker Hub in image references
+DOCKER_HUB_HOSTS = {'docker.io', 'index.docker.io', 'registry-1.docker.io'}
+# Registry that serves the manifests of Docker Hub images
+DOCKER_HUB_REGISTRY = 'registry-1.docker.io'
+# Registry hosts that are served over plain HTTP
+INSECURE_HOSTS = {'localhost', '127.0.0.1'}
+OCI_TAGS_URL = '%s://%s/v2/%s/tags/list'
+OCI_MANIFEST_URL = '%s://%s/v2/%s/manifests/%s'
+MANIFEST_TYPES = ', '.join([
+    'application/vnd.oci.image.index.v1+json',
+    'application/vnd.oci.image.manifest.v1+json',
+    'application/vnd.docker.distribution.manifest.list.v2+json',
+    'application/vnd.docker.distribution.manifest.v2+json',
+])
+
+
+class TagIndex:
+    """Sorted index of the tags of an image repository"""
+
+    def __init__(self, tags: Iterable[str] = (), complete: bool = True) -> None:
+        self.tags: list[str] = sorted(set(tags))
+        # Whether every tag of the repository has been listed
+        self.complete = complete
+
+    def __contains__(self, tag: object) -> bool:
+        if not isinstance(tag, str):
+            return False
+        position = bisect.bisect_left(self.tags, tag)
+        return position < len(self.tags) and self.tags[position] == tag
+
+    def __len__(self) -> int:
+        return len(self.tags)
+
+    def add(self, tags: Iterable[str]) -> None:
+        """Merge tags into the index"""
+        self.tags = sorted(set(self.tags).union(tags))
+
+
+def tag_name_filter(version: str) -> str:
+    """
+    Return the longest alphabetic part of a version (e.g. "slim-bookworm"
+    for "3.9-slim-bookworm"), which every candidate update also contains
+    """
+    parts = re.findall(r'[A-Za-z][A-Za-z-]*[A-Za-z]', version)
+    if not parts:
+        return ''
+    return str(max(parts, key=len))
+
+
+def split_registry(image: str) -> tuple[str, str]:
+    """
+    Split an image reference into its registry host and repository.
+    The host is empty for Docker Hub images, whose repository always
+    includes a namespace (e.g. "library/debian").
+    """
+    first, separator, rest = image.partition('/')
+    host = ''
+    if separator and ('.' in first or ':' in first or first == 'localhost'):
+        host, image = first, rest
+    if host in DOCKER_HUB_HOSTS:
+        host = ''
+    if not host and '/' not in image:
+        image = 'library/' + image
+    return host, image
+
+
+def parse_challenge(value: str) -> tuple[str, dict[str, str]]:
+    """
+    Parse a WWW-Authenticate header like 'Bearer realm="...",scope="..."'
+    into its lowercased scheme and parameters
+    """
+    scheme, _, params = value.strip().partition(' ')
+    return scheme.lower(), dict(re.findall(r'(\w+)="([^"]*)"', params))
+
+
+def tag_page(page: Any) -> dict[str, Any]:
+    """
+    Reduce a page of Docker Hub tags to tag names, the next page and the
+    total number of matching tags
+    """
+    return {
+        'next': page.get('next'),
+        'names': [str(result['name']) for result in page['results']],
+        'count': int(page.get('count') or 0),
+    }
+
+
+class DockerHub:
+    """Client for listing tags on hub.docker.com"""
+
+    def __init__(self, util: Util) -> None:
+        self.util = util
+        self.util.register_projection(DOCKER_HUB_TAG_PAGES, tag_page)
+
+    def tag_url(self, namespace: str, name: str, tag: str) -> str:
+        """Return the URL that describes a single tag"""
+        # Documentation: https://docs.docker.com/reference/api/hub/latest/#tag/repositories/paths/
+        return (DOCKER_HUB_TAGS_URL % (namespace, name)) + '/' + tag
+
+    def list_tags(self, namespace: str, name: str, name_filter: str = '') -> TagIndex:
+        """
+        List the tags of a repository, optionally only those containing
+        name_filter.  The index is incomplete if there were too many pages.
+        With a disk cache, the index is persisted and later refreshed
+        incrementally by paging through the most recently updated tags until
+        reaching tags that are already known.
+        Raises HTTPError, or KeyError/TypeError for malformed responses.
+        """
+        base_url = DOCKER_HUB_TAGS_URL % (namespace, name)
+        index_key = base_url + '?' + urlencode({'name': name_filter}) + '#index'
+        data = self.util.memoize(
+            index_key,
+            lambda: self._sync_tags(base_url, index_key, name_filter),
+        )
+        return TagIndex(data['tags'], data['complete'])
+
+    def _sync_tags(
+        self, base_url: str, index_key: str, name_filter: str,
+    ) -> dict[str, Any]:
+        known = None
+        disk_cache = self.util.disk_cache
+        entry = disk_cache.get_entry(index_key) if disk_cache else None
+        if entry is not None and 'value' in entry:
+            known = TagIndex(entry['value']['tags'], entry['value']['complete'])
+            if disk_cache and disk_cache.is_fresh(entry):
+                return dict(entry['value'])
+
+        params: dict[str, Any] = {'page_size': PAGE_SIZE, 'ordering': 'last_updated'}
+        if name_filter:
+            params['name'] = name_filter
+        url = base_url + '?' + urlencode(params)
+        tags: list[str] = []
+        pages = 0
+        caught_up = False
+        while url and pages < MAX_TAG_PAGES:
+            page = self.util.cached_request(url, {})
+            tags.extend(page['names'])
+            url = page['next']
+            pages += 1
+            if known is not None and all(tag in known for tag in page['names']):
+                caught_up = True
+                break
+            if known is None and page.get('count', 0) > MAX_TAG_PAGES * PAGE_SIZE:
+                # Listing would stop before it is complete anyway, so keep
+                # the most recent tags and probe for the rest
+                break
+        self.util.debug(
+            'Listed %d tags for %s in %d pages' % (len(tags), base_url, pages),
+        )
+        if known is not None and caught_up:
+            known.add(tags)
+            index = known
+        else:
+            index = TagIndex(tags, complete=not url)
+            if known is not None:
+                index.add(known.tags)
+        data = {'tags': index.tags, 'complete': index.complete}
+        if disk_cache:
+            disk_cache.set(index_key, data)
+        return data
+
+
+class OCIRegistry:
+    """
+    Client for listing tags from a registry that implements the OCI
+    distribution API, such as ghcr.io, quay.io or a private registry.
+    Bearer tokens are requested when the registry challenges a request and
+    are reused for the rest of the run.
+    """
+
+    def __init__(self, util: Util, host: str) -> None:
+        self.util = util
+        self.host = host
+        hostname = host.rsplit(':', maxsplit=1)[0]
+        self.scheme = 'http' if hostname in INSECURE_HOSTS else 'https'
+
+    def manifest_url(self, repository: str, tag: str) -> str:
+        """Return the URL of the manifest of a tag"""
+        return OCI_MANIFEST_URL % (self.scheme, self.host, repository, tag)
+
+    def list_tags(self, repository: str, name_filter: str = '') -> TagIndex:
+        """
+        List the tags of a repository that contain name_filter, following
+        Link headers.  The index is incomplete if there were too many pages.
+        Raises HTTPError, or KeyError/TypeError/ValueError for malformed
+        responses.
+        """
+        base_url = OCI_TAGS_URL % (self.scheme, self.host, repository)
+        data = self.util.memoize(
+            base_url + '#index', lambda: self._list_all_tags(base_url, repository),
+        )
+        tags = [tag for tag in data['tags'] if name_filter in tag]
+        return TagIndex(tags, data['complete'])
+
+    def _list_all_tags(self, base_url: str, repository: str) -> dict[str, Any]:
+        index_key = base_url + '#index'
+        disk_cache = self.util.disk_cache
+        cached = disk_cache.get(index_key) if disk_cache else None
+        if cached is not None:
+            return dict(cached)
+        url: Optional[str] = base_url + '?' + urlencode({'n': PAGE_SIZE})
+        tags: list[str] = []
+        pages = 0
+        while url and pages < MAX_TAG_PAGES:
+            response = self._send('GET', url, repository, {})
+            if int(response.status/100) != 2:
+                raise HTTPError(
+                    url, response.status, response.reason, response.headers, None,
+                )
+            tags.extend(str(tag) for tag in json.loads(response.body)['tags'] or [])
+            link = next_link(response.headers.get('link'))
+            url = urljoin(url, link) if link else None
+            pages += 1
+        self.util.debug(
+            'Listed %d tags for %s/%s in %d pages'
+            % (len(tags), self.host, repository, pages),
+        )
+        index = TagIndex(tags, complete=not url)
+        data = {'tags': index.tags, 'complete': index.complete}
+        if disk_cache:
+            disk_cache.set(index_key, data)
+        return data
+
+    def tag_exists(self, repository: str, tag: str) -> bool:
+        """
+        Return if a tag exists, using a HEAD request for its manifest.
+        Raises HTTPError for responses other than success or 404.
+        """
+        try:
+            self._manifest_digest(repository, tag)
+        except HTTPError as error:
+            if error.code != 404:
+                raise
+            return False
+        return True
+
+    def manifest_digest(self, repository: str, tag: str) -> str:
+        """
+        Return the digest of a tag's manifest (or manifest list), or an empty
+        string if the tag does not exist.
+        Raises HTTPError for responses other than success or 404.
+        """
+        try:
+            return self._manifest_digest(repository, tag)
+        except HTTPError as error:
+            if error.code != 404:
+                raise
+            return ''
+
+    def _manifest_digest(self, repository: str, tag: str) -> str:
+        """Return a manifest's digest, requesting it at most once per run"""
+        url = self.manifest_url(repository, tag)
+
+        def head_manifest() -> str:
+            headers = {'Accept': MANIFEST_TYPES}
+            response = self._send('HEAD', url, repository, headers)
+            if int(response.status/100) != 2:
+                raise HTTPError(
+                    url, response.status, response.reason, response.headers, None,
+                )
+            return response.headers.get('docker-content-digest', '')
+        return str(self.util.memoize(url + '#digest', head_manifest))
+
+    def _send(
+        self, method: str, url: str, repository: str, headers: dict[str, str],
+    ) -> Response:
+        """Send a request, authenticating if the registry challenges it"""
+        scope = 'repository:%s:pull' % repository
+        headers = dict(headers)
+        key = (self.host, scope)
+        with self.util.request_lock:
+            token = self.util.registry_tokens.get(key)
+        if token:
+            headers['Authorization'] = 'Bearer ' + token
+        response = self.util.send_request(method, url, headers)
+        if response.status != 401:
+            return response
+        # The token is missing or expired
+        challenge = response.headers.get('www-authenticate', '')
+        token = self._request_token(url, challenge, scope)
+        with self.util.request_lock:
+            self.util.registry_tokens[key] = token
+        headers['Authorization'] = 'Bearer ' + token
+        return self.util.send_request(method, url, headers)
+
+    def _request_token(self, url: str, challenge: str, scope: str) -> str:
+        """Request an anonymous bearer token as described by a challenge"""
+        scheme, params = parse_challenge(challenge)
+        if scheme != 'bearer' or 'realm' not in params:
+            raise HTTPError(url, 401, 'Unsupported authentication', None, None)
+        query = {'scope': params.get('scope', scope)}
+        if 'service' in params:
+            query['service'] = params['service']
+        token_url = params['realm'] + '?' + urlencode(query)
+        self.util.debug('Requesting token from %s' % token_url)
+        response = self.util.send_request('GET', token_url, {})
+        if int(response.status/100) != 2:
+            raise HTTPError(
+                token_url, response.status, response.reason, response.headers, None,
+            )
+        try:
+            body = json.loads(response.body)
+            return str(body.get('token') or body['access_token'])
+        except (ValueError, KeyError, TypeError, AttributeError) as error:
+            raise HTTPError(
+                token_url, 0, 'Malformed token response: %s' % error, None, None,
+            ) from error
@@ -6,11 +6,13 @@ import os
 import pathlib
 import subprocess
 import sys
+from typing import Optional
 
 current_path = pathlib.Path(os.path.dirname(os.path.abspath(__file__)))
 parent_path = current_path.parent.resolve()
 sys.path.insert(0, str(parent_path))
 
+from req_update.cache import DEFAULT_MAX_SIZE, DEFAULT_MEMORY_SIZE, DiskCache  # NOQA
 from req_update.docker import Docker  # NOQA
 from req_update.dockercompose import DockerCompose  # NOQA
 from req_update.drone import Drone  # NOQA
@@ -19,7 +21,18 @@ from req_update.gitsubmodule import GitSubmodule  # NOQA
 from req_update.go import Go  # NOQA
 from req_update.node import Node  # NOQA
 from req_update.python import Python  # NOQA
-from req_update.util import Updater, Util  # NOQA
+from req_update.snapshot import Snapshot  # NOQA
+from req_update.util import (  # NOQA
+    DEFAULT_JOBS,
+    GITHUB_API_HOST,
+    GITHUB_TAGS_API,
+    GITHUB_TAGS_GIT,
+    GITHUB_TOKEN_ENV,
+    GITHUB_TOKENS_ENV,
+    MIRRORS_ENV,
+    Updater,
+    Util,
+)
 
 
 VERSION = (2, 9, 1)
@@ -52,6 +65,7 @@ class ReqUpdate:
         self.updated_files: set[str] = set([])
         self.util = Util()
         self.language: str = ''
+        self.export_snapshot: Optional[pathlib.Path] = None
         self.updaters: list[Updater] = []
         for updater in UPDATERS:
             u = updater(self.util)
@@ -90,6 +104,9 @@ class ReqUpdate:
             updates_made = updates_made or updates
         if branch_created and not updates_made:
             self.util.rollback_branch()
+        self.util.report_request_stats()
+        if self.export_snapshot and self.util.snapshot:
+            self.util.snapshot.save(self.export_snapshot)
         return updates_made
 
     def get_args(self) -> argparse.Namespace:
@@ -129,6 +146,72 @@ class ReqUpdate:
             action='store_true',
             help='Verbose output',
         )
+        parser.add_argument(
+            '-j',
+            '--jobs',
+            type=int,
+            default=DEFAULT_JOBS,
+            help='Number of concurrent registry lookups',
+        )
+        parser.add_argument(
+            '--cache-dir',
+            type=pathlib.Path,
+            help='Directory to persist registry responses between runs',
+        )
+        parser.add_argument(
+            '--cache-ttl',
+            action='append',
+            default=[],
+            metavar='HOST=SECONDS',
+            help='Seconds that cached responses from a host stay fresh',
+        )
+        parser.add_argument(
+            '--cache-max-size',
+            type=int,
+            default=DEFAULT_MAX_SIZE,
+            metavar='BYTES',
+            help='Maximum size of the cache directory',
+        )
+        parser.add_argument(
+            '--memory-cache-size',
+            type=int,
+            default=DEFAULT_MEMORY_SIZE,
+            metavar='BYTES',
+            help='Maximum size of registry responses kept in memory',
+        )
+        parser.add_argument(
+            '--mirror',
+            action='append',
+            default=[],
+            metavar='ORIGIN=MIRROR',
+            help=(
+                'Base URL to try before an origin base URL, like '
+                'https://registry-1.docker.io=http://mirror:5000\n'
+                'Also read from the %s environment variable' % MIRRORS_ENV
+            ),
+        )
+        parser.add_argument(
+            '--github-tags',
+            choices=[GITHUB_TAGS_API, GITHUB_TAGS_GIT],
+            default=GITHUB_TAGS_API,
+            help=(
+                'List GitHub Actions tags with the GitHub API or with git '
+                'ls-remote, which uses no API quota'
+            ),
+        )
+        snapshot_group = parser.add_mutually_exclusive_group()
+        snapshot_group.add_argument(
+            '--export-snapshot',
+            type=pathlib.Path,
+            metavar='FILE',
+            help='Save registry responses from this run to a snapshot file',
+        )
+        snapshot_group.add_argument(
+            '--offline',
+            type=pathlib.Path,
+            metavar='FILE',
+            help='Read registry responses only from a snapshot file',
+        )
         parser.add_argument(
             '--version',
             action='version',
@@ -140,8 +223,54 @@ class ReqUpdate:
         self.util.verbose = args.verbose
         self.util.ignore_cleanliness = args.ignore_cleanliness
         self.util.dry_run = args.dryrun
+        self.util.jobs = max(args.jobs, 1)
+        self.util.request_cache.max_size = args.memory_cache_size
+        cache_ttls = ReqUpdate.parse_cache_ttls(parser, args.cache_ttl)
+        if args.cache_dir:
+            self.util.disk_cache = DiskCache(
+                args.cache_dir, cache_ttls, args.cache_max_size,
+            )
+        mirrors = os.environ.get(MIRRORS_ENV, '').replace(',', ' ').split()
+        self.util.mirrors = ReqUpdate.parse_mirrors(parser, mirrors + args.mirror)
+        tokens = os.environ.get(GITHUB_TOKEN_ENV, '').split()
+        tokens += os.environ.get(GITHUB_TOKENS_ENV, '').replace(',', ' ').split()
+        self.util.set_tokens(GITHUB_API_HOST, list(dict.fromkeys(tokens)))
+        self.util.github_tags = args.github_tags
+        if args.export_snapshot:
+            self.export_snapshot = args.export_snapshot
+            self.util.snapshot = Snapshot()
+        if args.offline:
+            try:
+                self.util.snapshot = Snapshot.load(args.offline)
+            except (OSError, ValueError) as error:
+                parser.error('Cannot read snapshot: %s' % error)
+            self.util.offline = True
         return args
 
+    @staticmethod
+    def parse_cache_ttls(
+        parser: argparse.ArgumentParser, values: list[str],
+    ) -> dict[str, int]:
+        ttls: dict[str, int] = {}
+        for value in values:
+            host, _, seconds = value.partition('=')
+            if not host or not seconds.isdigit():
+                parser.error('Invalid --cache-ttl %s' % value)
+            ttls[host] = int(seconds)
+        return ttls
+
+    @staticmethod
+    def parse_mirrors(
+        parser: argparse.ArgumentParser, values: list[str],
+    ) -> dict[str, str]:
+        mirrors: dict[str, str] = {}
+        for value in values:
+            origin, _, mirror = value.partition('=')
+            if '://' not in origin or '://' not in mirror:
+                parser.error('Invalid --mirror %s' % value)
+            mirrors[origin] = mirror
+        return mirrors
+
     @staticmethod
     def updater_names() -> list[str]:
         return [u.__name__.lower() for u in UPDATERS]
@@ -0,0 +1,68 @@
+from __future__ import annotations
+import json
+import os
+from pathlib import Path
+import tempfile
+import threading
+from typing import Any, Iterable, Optional
+
+
+SNAPSHOT_VERSION = 1
+
+
+class Snapshot:
+    """
+    Registry knowledge recorded during a run (responses, tag indexes, tag
+    existence and digests) keyed like the request cache.  A snapshot saved to
+    a file can be the only source of truth for a later run without network
+    access.
+    """
+
+    def __init__(
+        self,
+        entries: Optional[dict[str, Any]] = None,
+        missing: Iterable[str] = (),
+    ) -> None:
+        self.entries: dict[str, Any] = dict(entries or {})
+        # Keys that are known to 404
+        self.missing: set[str] = set(missing)
+        self.lock = threading.Lock()
+
+    def record(self, key: str, value: Any) -> None:
+        """Record the value of a key"""
+        with self.lock:
+            self.entries[key] = value
+            self.missing.discard(key)
+
+    def record_missing(self, key: str) -> None:
+        """Record that a key is known to be missing"""
+        with self.lock:
+            self.entries.pop(key, None)
+            self.missing.add(key)
+
+    def save(self, path: Path) -> None:
+        """Atomically write the snapshot to a file"""
+        with self.lock:
+            data = {
+                'version': SNAPSHOT_VERSION,
+                'entries': self.entries,
+                'missing': sorted(self.missing),
+            }
+            directory = path.parent
+            directory.mkdir(parents=True, exist_ok=True)
+            handle, temp_path = tempfile.mkstemp(dir=directory)
+            with os.fdopen(handle, 'w') as temp_file:
+                json.dump(data, temp_file, sort_keys=True)
+            os.replace(temp_path, path)
+
+    @staticmethod
+    def load(path: Path) -> Snapshot:
+        """
+        Read a snapshot from a file.
+        Raises OSError, or ValueError if the file is not a snapshot.
+        """
+        with open(path, 'r') as handle:
+            data = json.load(handle)
+        if not isinstance(data, dict) or data.get('version') != SNAPSHOT_VERSION:
+            raise ValueError('%s is not a req-update snapshot' % path)
+        return Snapshot(data['entries'], data['missing'])
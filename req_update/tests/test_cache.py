@@ -0,0 +1,150 @@
+from __future__ import annotations
+import os
+from pathlib import Path
+import tempfile
+import time
+import unittest
+
+from req_update import cache
+
+
+class BaseTest(unittest.TestCase):
+    def setUp(self) -> None:
+        self.tempdir = tempfile.TemporaryDirectory()
+        self.directory = Path(self.tempdir.name) / 'cache'
+        self.cache = cache.DiskCache(self.directory)
+
+    def tearDown(self) -> None:
+        self.tempdir.cleanup()
+
+
+class TestTTL(BaseTest):
+    def test_default_hosts(self) -> None:
+        self.assertEqual(
+            self.cache.ttl('https://hub.docker.com/v2/repositories'),
+            cache.DEFAULT_TTLS['hub.docker.com'],
+        )
+        self.assertEqual(
+            self.cache.ttl('https://example.com/'),
+            cache.DEFAULT_TTL,
+        )
+
+    def test_override(self) -> None:
+        disk_cache = cache.DiskCache(self.directory, {'example.com': 5})
+        self.assertEqual(disk_cache.ttl('https://example.com/'), 5)
+
+
+class TestGetSet(BaseTest):
+    def test_get_missing(self) -> None:
+        self.assertIsNone(self.cache.get('https://example.com/'))
+
+    def test_set_get(self) -> None:
+        self.cache.set('https://example.com/', {'asdf': 'qwer'})
+        self.assertEqual(self.cache.get('https://example.com/'), {'asdf': 'qwer'})
+        self.assertIsNone(self.cache.get('https://example.com/other'))
+
+    def test_expired(self) -> None:
+        disk_cache = cache.DiskCache(self.directory, {'example.com': 0})
+        disk_cache.set('https://example.com/', {'asdf': 'qwer'})
+        path = disk_cache.path('https://example.com/')
+        os.utime(path, (time.time() - 10, time.time() - 10))
+        time.sleep(0.01)
+        self.assertIsNone(disk_cache.get('https://example.com/'))
+
+    def test_get_entry_expired(self) -> None:
+        disk_cache = cache.DiskCache(self.directory, {'example.com': -1})
+        disk_cache.set('https://example.com/', 'asdf', {'etag': '"abc"'})
+        entry = disk_cache.get_entry('https://example.com/')
+        assert entry is not None
+        self.assertFalse(disk_cache.is_fresh(entry))
+        self.assertEqual(entry['value'], 'asdf')
+        self.assertEqual(entry['validators'], {'etag': '"abc"'})
+
+    def test_set_missing(self) -> None:
+        self.cache.set_missing('https://example.com/')
+        self.assertIsNone(self.cache.get('https://example.com/'))
+        entry = self.cache.get_entry('https://example.com/')
+        assert entry is not None
+        self.assertTrue(entry['missing'])
+        self.assertTrue(self.cache.is_fresh(entry))
+
+    def test_missing_expires_sooner(self) -> None:
+        disk_cache = cache.DiskCache(
+            self.directory, {'example.com': 100}, negative_ttls={'example.com': -1},
+        )
+        disk_cache.set_missing('https://example.com/')
+        entry = disk_cache.get_entry('https://example.com/')
+        assert entry is not None
+        self.assertFalse(disk_cache.is_fresh(entry))
+
+    def test_corrupt(self) -> None:
+        self.cache.set('https://example.com/', {'asdf': 'qwer'})
+        with open(self.cache.path('https://example.com/'), 'w') as handle:
+            handle.write('not json')
+        self.assertIsNone(self.cache.get('https://example.com/'))
+
+
+class TestEvict(BaseTest):
+    def test_evicts_least_recently_used(self) -> None:
+        self.cache.set('https://example.com/1', 'a' * 100)
+        size = self.cache.path('https://example.com/1').stat().st_size
+        self.cache.max_size = size * 2 + size // 2
+        self.cache.set('https://example.com/2', 'a' * 100)
+        past = time.time() - 100
+        os.utime(self.cache.path('https://example.com/1'), (past, past))
+        os.utime(self.cache.path('https://example.com/2'), (past + 1, past + 1))
+        self.cache.get('https://example.com/1')
+        self.cache.set('https://example.com/3', 'a' * 100)
+        self.assertIsNotNone(self.cache.get('https://example.com/1'))
+        self.assertIsNone(self.cache.get('https://example.com/2'))
+        self.assertIsNotNone(self.cache.get('https://example.com/3'))
+
+    def test_tracks_size(self) -> None:
+        self.cache.set('https://example.com/1', 'a' * 100)
+        self.cache.set('https://example.com/1', 'a' * 200)
+        self.cache.set('https://example.com/2', 'a' * 100)
+        total = sum(path.stat().st_size for path in self.directory.glob('*.json'))
+        self.assertEqual(self.cache.size, total)
+        self.assertEqual(cache.DiskCache(self.directory).size, total)
+
+    def test_only_scans_when_full(self) -> None:
+        scans = []
+        entries = self.cache._entries
+
+        def counted_entries() -> list[tuple[float, int, Path]]:
+            scans.append(1)
+            return entries()
+        setattr(self.cache, '_entries', counted_entries)
+        for i in range(10):
+            self.cache.set('https://example.com/%d' % i, 'a' * 100)
+        self.assertEqual(scans, [])
+
+
+class TestMemoryCache(unittest.TestCase):
+    def test_get_set(self) -> None:
+        memory_cache = cache.MemoryCache()
+        self.assertNotIn('a', memory_cache)
+        memory_cache['a'] = [1, 2]
+        self.assertIn('a', memory_cache)
+        self.assertEqual(memory_cache['a'], [1, 2])
+        self.assertEqual(memory_cache.size, len('[1, 2]'))
+        memory_cache['a'] = [1]
+        self.assertEqual(memory_cache.size, len('[1]'))
+        self.assertEqual(len(memory_cache), 1)
+
+    def test_evicts_least_recently_used(self) -> None:
+        memory_cache = cache.MemoryCache(max_size=10)
+        memory_cache['a'] = 'aaa'
+        memory_cache['b'] = 'bbb'
+        self.assertEqual(memory_cache['a'], 'aaa')
+        memory_cache['c'] = 'ccc'
+        self.assertIn('a', memory_cache)
+        self.assertNotIn('b', memory_cache)
+        self.assertIn('c', memory_cache)
+        self.assertLessEqual(memory_cache.size, 10)
+
+    def test_skips_oversized(self) -> None:
+        memory_cache = cache.MemoryCache(max_size=2)
+        memory_cache['a'] = 'aaa'
+        self.assertNotIn('a', memory_cache)
+        self.assertEqual(memory_cache.size, 0)
@@ -1,11 +1,12 @@
 from __future__ import annotations
 import os
 from pathlib import Path
+import random
 import tempfile
 import unittest
-from unittest.mock import MagicMock
+from unittest.mock import MagicMock, patch
 
-from req_update import docker, util
+from req_update import docker, dockercompose, registry, util
 
 
 def debian_side_effect(url: str, params: dict[str, str]) -> bool:
@@ -16,6 +17,10 @@ def debian_side_effect(url: str, params: dict[str, str]) -> bool:
     raise util.HTTPError('', 404, 'Not Found', None, None)
 
 
+def debian_exists(url: str, params: dict[str, str]) -> bool:
+    return url.endswith('/11') or url.endswith('/12')
+
+
 class BaseTest(unittest.TestCase):
     def setUp(self) -> None:
         u = util.Util()
@@ -31,6 +36,8 @@ class BaseTest(unittest.TestCase):
 
         self.mock_request = MagicMock()
         setattr(u, 'cached_request', self.mock_request)
+        self.mock_exists = MagicMock(side_effect=debian_exists)
+        setattr(u, 'check_exists', self.mock_exists)
         self.mock_commit = MagicMock()
         setattr(self.docker.util, 'commit_dependency_update', self.mock_commit)
 
@@ -40,6 +47,7 @@ class BaseTest(unittest.TestCase):
 
     def add_update_file(self, relative_path: str, contents: str) -> Path:
         absolute_path = Path(os.getcwd()) / relative_path
+        absolute_path.parent.mkdir(parents=True, exist_ok=True)
         absolute_path.touch()
         with open(absolute_path, 'w') as handle:
             handle.write(contents)
@@ -79,6 +87,8 @@ class TestUpdateDependencies(BaseTest):
 
     def test_no_update(self) -> None:
         self.mock_request.side_effect = util.HTTPError('url', 404, 'msg', None, None)
+        self.mock_exists.side_effect = None
+        self.mock_exists.return_value = False
         self.docker.update_dependencies()
         lines = self.docker.read_update_file(self.update_file)
         self.assertEqual(lines, ['FROM debian:10', 'RUN echo'])
@@ -100,6 +110,62 @@ class TestUpdateDependencies(BaseTest):
             ('Docker', 'debian', '12'),
         )
 
+    def test_writes_once(self) -> None:
+        with open(self.update_file, 'w') as handle:
+            handle.write('FROM debian:10\nFROM debian:11')
+        self.mock_request.side_effect = debian_side_effect
+        with patch('builtins.open', wraps=open) as mock_open:
+            self.docker.update_dependencies()
+        writes = [c for c in mock_open.call_args_list if c[0][1:] == ('w',)]
+        self.assertEqual(len(writes), 1)
+        lines = self.docker.read_update_file(self.update_file)
+        self.assertEqual(lines, ['FROM debian:12', 'FROM debian:12'])
+
+
+class TestPrefetchVersions(BaseTest):
+    def setUp(self) -> None:
+        super().setUp()
+        self.mock_find_updated_version = MagicMock(return_value='12')
+        setattr(self.docker, 'find_updated_version', self.mock_find_updated_version)
+
+    def test_prefetch(self) -> None:
+        other_file = self.add_update_file(
+            'sub/Dockerfile', 'FROM debian:10\nFROM python:3.10\nFROM scratch',
+        )
+        self.docker.prefetch_versions([self.update_file, other_file])
+        calls = sorted(c[0] for c in self.mock_find_updated_version.call_args_list)
+        self.assertEqual(calls, [('debian', '10'), ('python', '3.10')])
+        self.assertEqual(
+            self.docker.util.resolved_versions[('docker.io', 'debian', '10')], '12',
+        )
+
+    def test_update_uses_prefetch(self) -> None:
+        self.docker.update_dependencies()
+        self.assertEqual(self.mock_find_updated_version.call_count, 1)
+        lines = self.docker.read_update_file(self.update_file)
+        self.assertEqual(lines, ['FROM debian:12', 'RUN echo'])
+
+    def test_prefetch_digests(self) -> None:
+        other_file = self.add_update_file('sub/Dockerfile', '\n'.join([
+            'FROM debian:10@sha256:a',
+            'FROM debian:10@sha256:a AS base',
+            'FROM python:3.10@sha256:b',
+        ]))
+        self.mock_find_updated_version.side_effect = (
+            lambda dependency, version: '' if dependency == 'python' else '12'
+        )
+        mock_digest = MagicMock(return_value='sha256:c')
+        setattr(
+            self.docker.oci_registry('registry-1.docker.io'),
+            'manifest_digest',
+            mock_digest,
+        )
+        self.docker.prefetch_versions([self.update_file, other_file])
+        mock_digest.assert_called_once_with('library/debian', '12')
+        self.assertEqual(
+            self.docker.util.resolved_digests[('debian', '12')], 'sha256:c',
+        )
+
 
 class TestReadDockerfile(BaseTest):
     def test_read(self) -> None:
@@ -136,6 +202,42 @@ class TestAttemptUpdateImage(BaseTest):
         self.assertTrue(self.mock_find_updated_version.called)
         self.assertEqual(version, '12')
 
+    def test_registry_port(self) -> None:
+        self.mock_find_updated_version.return_value = '5001'
+        new_line, dependency, version = self.docker.attempt_update_image(
+            'FROM localhost:5000/app:5000',
+        )
+        self.assertEqual(new_line, 'FROM localhost:5000/app:5001')
+        self.assertEqual(dependency, 'localhost:5000/app')
+
+    def test_digest(self) -> None:
+        self.mock_find_updated_version.return_value = '12'
+        mock_digest = MagicMock(return_value='sha256:new')
+        setattr(
+            self.docker.oci_registry('registry-1.docker.io'),
+            'manifest_digest',
+            mock_digest,
+        )
+        new_line, dependency, version = self.docker.attempt_update_image(
+            'FROM debian:10@sha256:old AS base',
+        )
+        self.assertEqual(new_line, 'FROM debian:12@sha256:new AS base')
+        self.assertEqual(version, '12')
+        mock_digest.assert_called_once_with('library/debian', '12')
+
+    def test_missing_digest(self) -> None:
+        self.mock_find_updated_version.return_value = '12'
+        setattr(self.docker.util, 'warn', MagicMock())
+        setattr(
+            self.docker.oci_registry('registry-1.docker.io'),
+            'manifest_digest',
+            MagicMock(return_value=''),
+        )
+        line = 'FROM debian:10@sha256:old'
+        new_line, dependency, version = self.docker.attempt_update_image(line)
+        self.assertEqual(new_line, line)
+        self.assertEqual(version, '')
+
     def test_discards_ignore(self) -> None:
         new_line, dependency, version = self.docker.attempt_update_image(
             'FROM debian:12  # req-update: ignore',
@@ -146,6 +248,40 @@ class TestAttemptUpdateImage(BaseTest):
         self.assertFalse(self.mock_find_updated_version.called)
 
 
+class TestParseImage(BaseTest):
+    def test_parse(self) -> None:
+        self.assertEqual(self.docker.parse_image('FROM debian:10'), ('debian', '10'))
+        self.assertEqual(self.docker.parse_image('FROM debian'), ('debian', ''))
+        self.assertEqual(self.docker.parse_image('RUN echo'), ('', ''))
+        self.assertEqual(
+            self.docker.parse_image('FROM debian:10 # req-update: ignore'),
+            ('', ''),
+        )
+
+    def test_parse_registry(self) -> None:
+        self.assertEqual(
+            self.docker.parse_image('FROM localhost:5000/team/app:1.0'),
+            ('localhost:5000/team/app', '1.0'),
+        )
+        self.assertEqual(
+            self.docker.parse_image('FROM localhost:5000/team/app'),
+            ('localhost:5000/team/app', ''),
+        )
+
+    def test_parse_digest(self) -> None:
+        self.assertEqual(
+            self.docker.parse_reference('FROM debian:10@sha256:abcd AS base'),
+            ('debian', '10', 'sha256:abcd'),
+        )
+        self.assertEqual(
+            self.docker.parse_reference('FROM debian@sha256:abcd'),
+            ('debian', '', 'sha256:abcd'),
+        )
+        self.assertEqual(
+            self.docker.parse_image('FROM debian:10@sha256:abcd'), ('debian', '10'),
+        )
+
+
 class TestFindUpdatedVersion(BaseTest):
     def setUp(self) -> None:
         super().setUp()
@@ -157,31 +293,133 @@ class TestFindUpdatedVersion(BaseTest):
         version = self.docker.find_updated_version('debian', '10')
         self.assertEqual(version, '12')
         self.assertIn('library/debian', self.mock_request.call_args[0][0])
-        self.assertEqual(self.docker.known_versions['debian'], '12')
+        urls = [c[0][0] for c in self.mock_exists.call_args_list]
+        self.assertIn(self.docker.docker_hub.tag_url('library', 'debian', '12'), urls)
 
     def test_warns_on_exception(self) -> None:
         self.mock_request.side_effect = util.HTTPError('url', 404, 'msg', None, None)
+        self.mock_exists.side_effect = None
+        self.mock_exists.return_value = False
         version = self.docker.find_updated_version('debian', '10')
         self.assertEqual(version, '')
         self.assertIn('library/debian', self.mock_request.call_args[0][0])
-        self.assertEqual(self.docker.known_versions['debian'], '10')
 
     def test_namespaced_library(self) -> None:
         self.mock_request.side_effect = util.HTTPError('url', 404, 'msg', None, None)
+        self.mock_exists.side_effect = None
+        self.mock_exists.return_value = False
         version = self.docker.find_updated_version('albertyw/ssh-client', '10')
         self.assertEqual(version, '')
         self.assertIn('albertyw/ssh-client', self.mock_request.call_args[0][0])
-        self.assertEqual(self.docker.known_versions['albertyw/ssh-client'], '10')
+
+    def test_uses_tag_index(self) -> None:
+        self.mock_request.return_value = {'next': None, 'names': ['10', '11', '12']}
+        version = self.docker.find_updated_version('debian', '10')
+        self.assertEqual(version, '12')
+        self.mock_request.assert_called_once()
+        self.assertIn('library/debian/tags?', self.mock_request.call_args[0][0])
+
+    def test_incomplete_tag_index(self) -> None:
+        self.mock_request.return_value = {
+            'next': 'https://hub.docker.com/next', 'names': ['11'],
+        }
+        with patch('req_update.registry.MAX_TAG_PAGES', 1):
+            version = self.docker.find_updated_version('debian', '10')
+        self.assertEqual(version, '12')
+        urls = [c[0][0] for c in self.mock_exists.call_args_list]
+        tag_url = self.docker.docker_hub.tag_url
+        self.assertNotIn(tag_url('library', 'debian', '11'), urls)
+        self.assertIn(tag_url('library', 'debian', '12'), urls)
+
+    def test_other_registry(self) -> None:
+        oci_registry = self.docker.oci_registry('ghcr.io')
+        mock_list_tags = MagicMock(
+            return_value=registry.TagIndex(['1.0', '1.1', '2.0']),
+        )
+        setattr(oci_registry, 'list_tags', mock_list_tags)
+        version = self.docker.find_updated_version('ghcr.io/owner/team/app', '1.0')
+        self.assertEqual(version, '2.0')
+        mock_list_tags.assert_called_once_with('owner/team/app', '')
+        self.assertFalse(self.mock_request.called)
+        self.assertFalse(self.mock_exists.called)
+
+    def test_registry_mirror(self) -> None:
+        self.docker.util.mirrors = {
+            'https://registry-1.docker.io': 'http://mirror:5000',
+        }
+        oci_registry = self.docker.oci_registry('registry-1.docker.io')
+        mock_list_tags = MagicMock(return_value=registry.TagIndex(['10', '11']))
+        setattr(oci_registry, 'list_tags', mock_list_tags)
+        version = self.docker.find_updated_version('debian', '10')
+        self.assertEqual(version, '11')
+        mock_list_tags.assert_called_once_with('library/debian', '')
+        self.assertFalse(self.mock_request.called)
+
+    def test_skips_versions_without_numbers(self) -> None:
+        version = self.docker.find_updated_version('debian', 'bookworm')
+        self.assertEqual(version, '')
+        self.assertFalse(self.mock_request.called)
+        self.assertFalse(self.mock_exists.called)
 
     def test_skips_latest(self) -> None:
         version = self.docker.find_updated_version('debian', 'latest')
         self.assertEqual(version, '')
 
-    def test_uses_known_versions(self) -> None:
-        self.docker.known_versions['debian'] = '13'
+    def test_does_not_reuse_other_versions(self) -> None:
+        self.mock_request.side_effect = debian_side_effect
+        self.assertEqual(self.docker.resolve_version('debian', '10'), '12')
+        self.assertEqual(self.docker.resolve_version('debian', '12'), '')
+
+
+class TestResolveVersion(BaseTest):
+    def test_shared_between_updaters(self) -> None:
+        self.mock_request.side_effect = debian_side_effect
+        self.assertEqual(self.docker.resolve_version('debian', '10'), '12')
+        self.mock_exists.reset_mock()
+        compose = dockercompose.DockerCompose(self.docker.util)
+        self.assertEqual(compose.resolve_version('debian', '10'), '12')
+        self.assertFalse(self.mock_exists.called)
+
+
+class TestSearchVersions(BaseTest):
+    def sequential_search(self, version: str, tags: set[str]) -> str:
+        for new_version in self.docker.util.generate_next_versions(version):
+            if new_version in tags:
+                return self.sequential_search(new_version, tags)
+        return version
+
+    def test_matches_sequential_search(self) -> None:
+        random.seed(1)
+        versions = ['%d.%d' % (a, b) for a in range(1, 6) for b in range(30)]
+        for _ in range(100):
+            tags = set(random.sample(versions, 60))
+
+            def exists(
+                candidates: list[str], tags: set[str] = tags,
+            ) -> list[bool]:
+                return [c in tags for c in candidates]
+            for start in ['1.0', '2.5', '4.29']:
+                self.assertEqual(
+                    self.docker.search_versions(start, exists),
+                    self.sequential_search(start, tags),
+                )
+
+    def test_gallops(self) -> None:
+        tags = {str(v) for v in range(1, 100)}
+        batches: list[list[str]] = []
+
+        def exists(candidates: list[str]) -> list[bool]:
+            batches.append(candidates)
+            return [c in tags for c in candidates]
+        self.assertEqual(self.docker.search_versions('0', exists), '99')
+        self.assertLess(len(batches), 10)
+
+    def test_probes_concurrently(self) -> None:
+        self.mock_request.side_effect = debian_side_effect
         version = self.docker.find_updated_version('debian', '10')
-        self.assertEqual(version, '13')
-        self.assertEqual(self.docker.known_versions['debian'], '13')
+        self.assertEqual(version, '12')
+        urls = [c[0][0] for c in self.mock_exists.call_args_list]
+        self.assertIn(self.docker.docker_hub.tag_url('library', 'debian', '13'), urls)
 
 
 class TestCommitDockerfile(BaseTest):
@@ -197,8 +435,10 @@ class TestCommitDockerfile(BaseTest):
     def test_commit(self) -> None:
         lines = ['asdf', 'qwer']
         self.docker.commit_dockerfile(self.update_file, lines, 'debian', '12')
-        with open(self.update_file, 'r') as handle:
-            data = handle.read()
-            self.assertEqual(data, 'asdf\nqwer')
-        self.assertEqual(self.docker.read_update_file(self.update_file), lines)
-        self.assertTrue(self.mock_commit_dependency_update.called)
+        command = ['git', 'show', ':Dockerfile']
+        staged = self.docker.util.execute_shell(command, True).stdout
+        self.assertEqual(staged, 'asdf\nqwer')
+        self.assertEqual(self.docker.read_update_file(self.update_file), self.lines)
+        self.mock_commit_dependency_update.assert_called_once_with(
+            'Docker', 'debian', '12', staged=True,
+        )
@@ -1,8 +1,59 @@
 from __future__ import annotations
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import json
+from pathlib import Path
+import re
+import tempfile
+import threading
 import unittest
 from unittest.mock import MagicMock
 
-from req_update import githubworkflow, util
+from req_update import githubworkflow, snapshot, util
+
+
+REPOSITORY_TAGS = {
+    'actions/checkout': ['v5.0.0', 'v5', 'v4'],
+    'actions/setup-python': ['v6', 'v5'],
+    'github/codeql-action': ['v4', 'v3'],
+}
+
+
+class GraphQLHandler(BaseHTTPRequestHandler):
+    """Stand-in for the GitHub GraphQL API that only resolves repository tags"""
+    protocol_version = 'HTTP/1.1'
+    queries: list[dict[str, str]] = []
+
+    def do_POST(self) -> None:  # NOQA: N802
+        length = int(self.headers['Content-Length'])
+        request = json.loads(self.rfile.read(length))
+        if self.headers.get('Authorization') == 'Bearer timeout':
+            self.send_json(200, {'data': None, 'errors': [{'message': 'timeout'}]})
+            return
+        if self.headers.get('Authorization') != 'Bearer token':
+            self.send_json(401, {'message': 'Bad credentials'})
+            return
+        GraphQLHandler.queries.append(request['variables'])
+        data: dict[str, object] = {}
+        for alias in re.findall(r'(r\d+): repository', request['query']):
+            i = alias[1:]
+            repository = '%s/%s' % (
+                request['variables']['owner' + i], request['variables']['name' + i],
+            )
+            tags = REPOSITORY_TAGS.get(repository)
+            data[alias] = None if tags is None else {
+                'refs': {'nodes': [{'name': tag} for tag in tags]},
+            }
+        self.send_json(200, {'data': data})
+
+    def send_json(self, status: int, data: object) -> None:
+        body = json.dumps(data).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format: str, *args: object) -> None:  # NOQA: A002
+        pass
 
 
 class TestUpdateFile(unittest.TestCase):
@@ -51,6 +102,36 @@ class TestAttemptUpdateImage(unittest.TestCase):
         self.assertEqual(dependency, 'actions/checkout')
         self.assertEqual(version, 'v5')
 
+    def test_sub_path(self) -> None:
+        self.mock_find_updated_version.return_value = 'v4'
+        line = '      - uses: github/codeql-action/init@v3'
+        new_line, dependency, version = self.githubworkflow.attempt_update_image(line)
+        self.assertEqual(new_line, '      - uses: github/codeql-action/init@v4')
+        self.assertEqual(dependency, 'github/codeql-action/init')
+        self.assertEqual(version, 'v4')
+
+    def test_shares_sub_path_lookups(self) -> None:
+        self.mock_find_updated_version.return_value = 'v4'
+        for line in [
+            '      - uses: github/codeql-action/init@v3',
+            '      - uses: github/codeql-action/analyze@v3',
+        ]:
+            _, _, version = self.githubworkflow.attempt_update_image(line)
+            self.assertEqual(version, 'v4')
+        self.assertEqual(self.mock_find_updated_version.call_count, 1)
+
+    def test_discards_unversioned(self) -> None:
+        for line in [
+            '      - uses: ./.github/actions/setup@v1',
+            '      - uses: docker://alpine@sha256:0123',
+        ]:
+            new_line, dependency, version = (
+                self.githubworkflow.attempt_update_image(line)
+            )
+            self.assertEqual(new_line, line)
+            self.assertEqual(version, '')
+        self.assertFalse(self.mock_find_updated_version.called)
+
     def test_discards_other(self) -> None:
         line = '      - run: pnpm install'
         new_line, dependency, version = self.githubworkflow.attempt_update_image(line)
@@ -66,18 +147,40 @@ class TestFindUpdatedVersion(unittest.TestCase):
         self.githubworkflow = githubworkflow.GithubWorkflow(u)
 
         self.mock_request = MagicMock()
-        setattr(u, 'cached_request', self.mock_request)
+        setattr(u, 'cached_pages', self.mock_request)
 
         self.mock_warn = MagicMock()
         setattr(self.githubworkflow.util, 'warn', self.mock_warn)
 
     def test_find_updated_version(self) -> None:
-        self.mock_request.return_value = [{"ref": "refs/tags/2"}]
+        self.mock_request.return_value = iter([['2']])
         version = self.githubworkflow.find_updated_version('albertyw/git-browse', '1')
         self.assertEqual(version, '2')
         self.assertIn('albertyw/git-browse', self.mock_request.call_args[0][0])
         self.assertFalse(self.mock_warn.called)
 
+    def test_pages(self) -> None:
+        self.mock_request.return_value = iter([['v2', 'v10.1'], ['v3.0', 'v11']])
+        version = self.githubworkflow.find_updated_version('actions/checkout', 'v4')
+        self.assertEqual(version, 'v11')
+        self.assertEqual(
+            self.mock_request.call_args[0][0],
+            'https://api.github.com/repos/actions/checkout/git/matching-refs/'
+            'tags/v?per_page=100',
+        )
+
+    def test_sub_path(self) -> None:
+        self.mock_request.return_value = iter([['v3', 'v4']])
+        version = self.githubworkflow.find_updated_version(
+            'github/codeql-action/init', 'v3',
+        )
+        self.assertEqual(version, 'v4')
+        self.assertEqual(
+            self.mock_request.call_args[0][0],
+            'https://api.github.com/repos/github/codeql-action/git/matching-refs/'
+            'tags/v?per_page=100',
+        )
+
     def test_http_error(self) -> None:
         http_error = util.HTTPError('url', 404, 'not found', None, None)
         self.mock_request.side_effect = http_error
@@ -86,19 +189,247 @@ class TestFindUpdatedVersion(unittest.TestCase):
         self.assertTrue(self.mock_warn.called)
 
     def test_malformed_response(self) -> None:
-        self.mock_request.return_value = 'malformed json'
+        self.mock_request.return_value = iter(['malformed json'])
+        version = self.githubworkflow.find_updated_version('albertyw/git-browse', '1')
+        self.assertEqual(version, '')
+        self.assertTrue(self.mock_warn.called)
+
+    def test_projection_error(self) -> None:
+        self.mock_request.side_effect = KeyError('ref')
         version = self.githubworkflow.find_updated_version('albertyw/git-browse', '1')
         self.assertEqual(version, '')
         self.assertTrue(self.mock_warn.called)
 
     def test_equal_version(self) -> None:
-        self.mock_request.return_value = [{"ref": "refs/tags/1"}]
+        self.mock_request.return_value = iter([['1']])
         version = self.githubworkflow.find_updated_version('albertyw/git-browse', '1')
         self.assertEqual(version, '')
         self.assertFalse(self.mock_warn.called)
 
     def test_old_version(self) -> None:
-        self.mock_request.return_value = [{"ref": "refs/tags/1"}]
+        self.mock_request.return_value = iter([['1']])
         version = self.githubworkflow.find_updated_version('albertyw/git-browse', '2')
         self.assertEqual(version, '')
         self.assertFalse(self.mock_warn.called)
+
+
+class TestTagPrefix(unittest.TestCase):
+    def test_tag_prefix(self) -> None:
+        self.assertEqual(githubworkflow.tag_prefix('v4'), 'v')
+        self.assertEqual(githubworkflow.tag_prefix('release-1.2'), 'release-')
+        self.assertEqual(githubworkflow.tag_prefix('1.2.3'), '')
+        self.assertEqual(githubworkflow.tag_prefix('main'), 'main')
+
+
+class TestTagNames(unittest.TestCase):
+    def test_tag_names(self) -> None:
+        refs = [
+            {'ref': 'refs/tags/v1', 'object': {'sha': 'abc'}},
+            {'ref': 'refs/tags/v2', 'object': {'sha': 'def'}},
+        ]
+        self.assertEqual(githubworkflow.tag_names(refs), ['v1', 'v2'])
+
+    def test_registered(self) -> None:
+        u = util.Util()
+        githubworkflow.GithubWorkflow(u)
+        url = githubworkflow.GITHUB_MATCHING_TAGS_URL % ('actions/checkout', 'v')
+        projected = u.project(url, [{'ref': 'refs/tags/v1'}])
+        self.assertEqual(projected, ['v1'])
+        other = u.project('https://hub.docker.com/', [{'ref': 'refs/tags/v1'}])
+        self.assertEqual(other, [{'ref': 'refs/tags/v1'}])
+
+
+class TestGraphQL(unittest.TestCase):
+    def setUp(self) -> None:
+        GraphQLHandler.queries = []
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), GraphQLHandler)
+        self.thread = threading.Thread(
+            target=self.server.serve_forever, args=(0.01,),
+        )
+        self.thread.start()
+        u = util.Util()
+        u.set_tokens('127.0.0.1', ['token'])
+        self.githubworkflow = githubworkflow.GithubWorkflow(u)
+        self.githubworkflow.graphql_url = (
+            'http://127.0.0.1:%d/graphql' % self.server.server_address[1]
+        )
+        self.mock_pages = MagicMock(return_value=iter([['v6']]))
+        setattr(u, 'cached_pages', self.mock_pages)
+        self.tempdir = tempfile.TemporaryDirectory()
+
+    def tearDown(self) -> None:
+        self.tempdir.cleanup()
+        self.githubworkflow.util.http_pool.close()
+        self.server.shutdown()
+        self.server.server_close()
+        self.thread.join()
+
+    def add_workflow(self, name: str, contents: str) -> Path:
+        path = Path(self.tempdir.name) / name
+        path.write_text(contents)
+        return path
+
+    def test_query(self) -> None:
+        query = githubworkflow.tags_query(['actions/checkout', 'albertyw/a'])
+        self.assertEqual(query['variables'], {
+            'owner0': 'actions', 'name0': 'checkout',
+            'owner1': 'albertyw', 'name1': 'a',
+        })
+        self.assertIn('r1: repository(owner: $owner1, name: $name1)', query['query'])
+
+    def test_fetch_graphql_tags(self) -> None:
+        tags = self.githubworkflow.fetch_graphql_tags(
+            ['actions/checkout', 'albertyw/missing'],
+        )
+        self.assertEqual(tags, {'actions/checkout': ['v5.0.0', 'v5', 'v4']})
+
+    def test_prefetch_batches(self) -> None:
+        files = [
+            self.add_workflow('a.yml', '      - uses: actions/checkout@v4\n'),
+            self.add_workflow('b.yml', '\n'.join([
+                '      - uses: actions/checkout@v4',
+                '      - uses: actions/setup-python@v5',
+            ])),
+        ]
+        self.githubworkflow.prefetch_versions(files)
+        self.assertEqual(len(GraphQLHandler.queries), 1)
+        self.assertEqual(
+            self.githubworkflow.find_updated_version('actions/checkout', 'v4'), 'v5',
+        )
+        self.assertEqual(
+            self.githubworkflow.find_updated_version('actions/setup-python', 'v5'),
+            'v6',
+        )
+        self.assertEqual(len(GraphQLHandler.queries), 1)
+        self.assertFalse(self.mock_pages.called)
+
+    def test_prefetch_sub_paths(self) -> None:
+        files = [self.add_workflow('a.yml', '\n'.join([
+            '      - uses: github/codeql-action/init@v3',
+            '      - uses: github/codeql-action/analyze@v3',
+        ]))]
+        self.githubworkflow.prefetch_versions(files)
+        self.assertEqual(
+            GraphQLHandler.queries,
+            [{'owner0': 'github', 'name0': 'codeql-action'}],
+        )
+        self.assertEqual(
+            self.githubworkflow.find_updated_version(
+                'github/codeql-action/analyze', 'v3',
+            ),
+            'v4',
+        )
+        self.assertFalse(self.mock_pages.called)
+
+    def test_batch_size(self) -> None:
+        dependencies = ['owner/repo%d' % i for i in range(30)]
+        self.githubworkflow.prefetch_graphql_tags(dependencies)
+        self.assertEqual(
+            [len(query) for query in GraphQLHandler.queries],
+            [githubworkflow.GRAPHQL_BATCH_SIZE * 2, 10],
+        )
+
+    def test_falls_back_to_rest(self) -> None:
+        self.githubworkflow.util.set_tokens('127.0.0.1', ['invalid'])
+        version = self.githubworkflow.find_updated_version('actions/setup-python', 'v5')
+        self.assertEqual(version, 'v6')
+        self.assertTrue(self.mock_pages.called)
+
+    def test_query_error(self) -> None:
+        self.githubworkflow.util.set_tokens('127.0.0.1', ['timeout'])
+        with self.assertRaises(ValueError):
+            self.githubworkflow.fetch_graphql_tags(['actions/checkout'])
+        self.mock_pages.side_effect = lambda url, headers: iter([['v6']])
+        files = [self.add_workflow('a.yml', '      - uses: actions/setup-python@v5\n')]
+        self.githubworkflow.prefetch_versions(files)
+        version = self.githubworkflow.find_updated_version('actions/setup-python', 'v5')
+        self.assertEqual(version, 'v6')
+        self.assertTrue(self.mock_pages.called)
+
+    def test_offline_without_token(self) -> None:
+        self.githubworkflow.util.snapshot = snapshot.Snapshot()
+        files = [self.add_workflow('a.yml', '      - uses: actions/checkout@v4\n')]
+        self.githubworkflow.prefetch_versions(files)
+        self.assertEqual(
+            self.githubworkflow.util.resolved_versions[
+                ('github.com', 'actions/checkout', 'v4')
+            ],
+            'v5',
+        )
+
+        offline = util.Util()
+        offline.snapshot = self.githubworkflow.util.snapshot
+        offline.offline = True
+        offline_workflow = githubworkflow.GithubWorkflow(offline)
+        mock_pages = MagicMock()
+        setattr(offline, 'cached_pages', mock_pages)
+        version = offline_workflow.find_updated_version('actions/checkout', 'v4')
+        self.assertEqual(version, 'v5')
+        self.assertFalse(mock_pages.called)
+
+    def test_missing_repository(self) -> None:
+        self.mock_pages.return_value = iter([['v2']])
+        version = self.githubworkflow.find_updated_version('albertyw/missing', 'v1')
+        self.assertEqual(version, 'v2')
+        self.assertTrue(self.mock_pages.called)
+
+
+class TestGitTags(unittest.TestCase):
+    def setUp(self) -> None:
+        self.tempdir = tempfile.TemporaryDirectory()
+        u = util.Util()
+        u.github_tags = util.GITHUB_TAGS_GIT
+        self.githubworkflow = githubworkflow.GithubWorkflow(u)
+        self.githubworkflow.git_url = 'file://%s/%%s' % self.tempdir.name
+        self.mock_warn = MagicMock()
+        setattr(u, 'warn', self.mock_warn)
+        self.add_repository('actions/checkout', ['v3', 'v4', 'v5.0.0', 'v5'])
+        self.add_repository('actions/setup-python', ['v5', 'v6'])
+
+    def tearDown(self) -> None:
+        self.tempdir.cleanup()
+
+    def add_repository(self, name: str, tags: list[str]) -> None:
+        path = Path(self.tempdir.name) / name
+        path.mkdir(parents=True)
+        git = ['git', '-c', 'user.name=test', '-c', 'user.email=test@example.com']
+        self.githubworkflow.util.execute_shell(['git', 'init'], True, cwd=path)
+        self.githubworkflow.util.execute_shell(
+            git + ['commit', '--allow-empty', '-m', 'commit'], True, cwd=path,
+        )
+        for tag in tags:
+            self.githubworkflow.util.execute_shell(['git', 'tag', tag], True, cwd=path)
+
+    def test_git_tags(self) -> None:
+        tags = self.githubworkflow.git_tags('actions/checkout')
+        self.assertEqual(sorted(tags), ['v3', 'v4', 'v5', 'v5.0.0'])
+
+    def test_find_updated_version(self) -> None:
+        mock_pages = MagicMock()
+        setattr(self.githubworkflow.util, 'cached_pages', mock_pages)
+        version = self.githubworkflow.find_updated_version('actions/checkout', 'v4')
+        self.assertEqual(version, 'v5')
+        self.assertFalse(mock_pages.called)
+
+    def test_prefetch(self) -> None:
+        path = Path(self.tempdir.name) / 'ci.yml'
+        path.write_text('\n'.join([
+            '      - uses: actions/checkout@v4',
+            '      - uses: actions/setup-python@v5',
+            '      - uses: actions/checkout@v3',
+        ]))
+        self.githubworkflow.prefetch_versions([path])
+        resolved = self.githubworkflow.util.resolved_versions
+        self.assertEqual(resolved[('github.com', 'actions/checkout', 'v3')], 'v5')
+        self.assertEqual(resolved[('github.com', 'actions/setup-python', 'v5')], 'v6')
+        # Each repository is only listed once
+        listed = [
+            key for key in self.githubworkflow.util.request_cache.entries
+            if key.endswith('#tags')
+        ]
+        self.assertEqual(len(listed), 2)
+
+    def test_missing_repository(self) -> None:
+        version = self.githubworkflow.find_updated_version('albertyw/missing', 'v1')
+        self.assertEqual(version, '')
+        self.assertTrue(self.mock_warn.called)
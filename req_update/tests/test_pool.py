@@ -0,0 +1,205 @@
+from __future__ import annotations
+import gzip
+import http.client
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import socket
+import threading
+import time
+import unittest
+from unittest.mock import patch
+import zlib
+
+from req_update import pool
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self) -> None:  # NOQA: N802
+        if self.path == '/error':
+            self.send_response(500)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        if self.path == '/slow':
+            time.sleep(0.2)
+        if self.path.startswith('/redirect'):
+            self.send_response(302)
+            self.send_header('Location', self.path.partition('=')[2] or '/ok')
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        body = b'{"path": "%s"}' % self.path.encode('utf-8')
+        if self.path == '/authorization':
+            body = self.headers.get('Authorization', '').encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        if 'gzip' in self.headers.get('Accept-Encoding', ''):
+            body = gzip.compress(body)
+            self.send_header('Content-Encoding', 'gzip')
+        self.send_header('Content-Length', str(len(body)))
+        try:
+            self.end_headers()
+            self.wfile.write(body)
+        except (BrokenPipeError, ConnectionResetError):
+            # The client gave up waiting, like in test_read_timeout
+            self.close_connection = True
+
+    def log_message(self, format: str, *args: object) -> None:  # NOQA: A002
+        pass
+
+
+class BaseTest(unittest.TestCase):
+    def setUp(self) -> None:
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.thread = threading.Thread(
+            target=self.server.serve_forever, args=(0.01,),
+        )
+        self.thread.start()
+        self.url = 'http://127.0.0.1:%d' % self.server.server_address[1]
+        self.pool = pool.ConnectionPool()
+
+    def tearDown(self) -> None:
+        self.pool.close()
+        self.server.shutdown()
+        self.server.server_close()
+        self.thread.join()
+
+
+class TestRequest(BaseTest):
+    def test_request(self) -> None:
+        response = self.pool.request('GET', self.url + '/a?b=c', {})
+        self.assertEqual(response.status, 200)
+        self.assertEqual(response.body, b'{"path": "/a?b=c"}')
+        self.assertEqual(response.headers['content-type'], 'application/json')
+        self.assertEqual(response.headers['content-encoding'], 'gzip')
+        self.assertNotEqual(response.wire_size, len(response.body))
+
+    def test_uncompressed(self) -> None:
+        headers = {'Accept-Encoding': 'identity'}
+        response = self.pool.request('GET', self.url + '/a', headers)
+        self.assertEqual(response.body, b'{"path": "/a"}')
+        self.assertEqual(response.wire_size, len(response.body))
+
+    def test_reuses_connection(self) -> None:
+        self.pool.request('GET', self.url + '/a', {})
+        self.pool.request('GET', self.url + '/b', {})
+        self.assertEqual(self.pool.connections_opened, 1)
+
+    def test_reconnects_closed_connection(self) -> None:
+        self.pool.request('GET', self.url + '/a', {})
+        for connections in self.pool.idle.values():
+            for connection in connections:
+                assert connection.sock is not None
+                connection.sock.close()
+        response = self.pool.request('GET', self.url + '/b', {})
+        self.assertEqual(response.body, b'{"path": "/b"}')
+
+    def test_redirect(self) -> None:
+        response = self.pool.request('GET', self.url + '/redirect', {})
+        self.assertEqual(response.status, 200)
+        self.assertEqual(response.body, b'{"path": "/ok"}')
+
+    def test_redirect_authorization(self) -> None:
+        headers = {'Authorization': 'Bearer token'}
+        response = self.pool.request(
+            'GET', self.url + '/redirect?to=/authorization', headers,
+        )
+        self.assertEqual(response.body, b'Bearer token')
+        other_host = self.url.replace('127.0.0.1', 'localhost')
+        response = self.pool.request(
+            'GET', self.url + '/redirect?to=%s/authorization' % other_host, headers,
+        )
+        self.assertEqual(response.body, b'')
+
+    def test_read_timeout(self) -> None:
+        timeout_pool = pool.ConnectionPool(read_timeout=0.05)
+        with self.assertRaises(socket.timeout):
+            timeout_pool.request('GET', self.url + '/slow', {})
+
+    def test_circuit_breaker(self) -> None:
+        for _ in range(pool.BREAKER_THRESHOLD):
+            response = self.pool.request('GET', self.url + '/error', {})
+            self.assertEqual(response.status, 500)
+        with self.assertRaises(pool.CircuitOpenError):
+            self.pool.request('GET', self.url + '/a', {})
+        for host_state in self.pool.hosts.values():
+            host_state.open_until = 0
+        response = self.pool.request('GET', self.url + '/a', {})
+        self.assertEqual(response.status, 200)
+
+
+class TestHostState(unittest.TestCase):
+    def test_additive_increase(self) -> None:
+        host_state = pool.HostState(4)
+        host_state.limit = 2
+        host_state.acquire()
+        host_state.release(True, 0.1)
+        self.assertEqual(host_state.limit, 2.5)
+
+    def test_multiplicative_decrease(self) -> None:
+        host_state = pool.HostState(4)
+        host_state.acquire()
+        host_state.release(True, pool.SLOW_RESPONSE + 1)
+        self.assertEqual(host_state.limit, 2)
+        host_state.acquire()
+        host_state.release(False, 0.1)
+        self.assertEqual(host_state.limit, 1)
+        host_state.acquire()
+        host_state.release(False, 0.1)
+        self.assertEqual(host_state.limit, 1)
+
+    def test_limits_concurrency(self) -> None:
+        host_state = pool.HostState(1)
+        host_state.acquire()
+        acquired = threading.Event()
+
+        def acquire() -> None:
+            host_state.acquire()
+            acquired.set()
+        thread = threading.Thread(target=acquire)
+        thread.start()
+        self.assertFalse(acquired.wait(0.05))
+        host_state.release(True, 0.1)
+        self.assertTrue(acquired.wait(1))
+        thread.join()
+
+    def test_half_open(self) -> None:
+        host_state = pool.HostState(4)
+        for _ in range(pool.BREAKER_THRESHOLD):
+            host_state.acquire()
+            host_state.release(False, 0.1)
+        with self.assertRaises(pool.CircuitOpenError):
+            host_state.acquire()
+        with patch('time.monotonic', return_value=time.monotonic() + 1000):
+            host_state.acquire()
+            host_state.release(False, 0.1)
+            with self.assertRaises(pool.CircuitOpenError):
+                host_state.acquire()
+
+
+class TestResponse(unittest.TestCase):
+    def test_lowercases_headers(self) -> None:
+        response = pool.Response(200, 'OK', {'ETag': 'abc'}, b'')
+        self.assertEqual(response.headers, {'etag': 'abc'})
+
+
+class TestDecodeBody(unittest.TestCase):
+    def test_identity(self) -> None:
+        self.assertEqual(pool.decode_body(b'asdf', ''), b'asdf')
+        self.assertEqual(pool.decode_body(b'asdf', 'identity'), b'asdf')
+
+    def test_gzip(self) -> None:
+        self.assertEqual(pool.decode_body(gzip.compress(b'asdf'), 'gzip'), b'asdf')
+
+    def test_deflate(self) -> None:
+        self.assertEqual(pool.decode_body(zlib.compress(b'asdf'), 'deflate'), b'asdf')
+        compressor = zlib.compressobj(wbits=-zlib.MAX_WBITS)
+        raw = compressor.compress(b'asdf') + compressor.flush()
+        self.assertEqual(pool.decode_body(raw, 'deflate'), b'asdf')
+
+    def test_invalid(self) -> None:
+        with self.assertRaises(http.client.HTTPException):
+            pool.decode_body(b'asdf', 'gzip')
+        with self.assertRaises(http.client.HTTPException):
+            pool.decode_body(b'asdf', 'br')
@@ -0,0 +1,197 @@
+from __future__ import annotations
+import unittest
+
+from req_update import ratelimit
+
+
+class FakeClock:
+    def __init__(self) -> None:
+        self.now = 1000.0
+        self.sleeps: list[float] = []
+
+    def clock(self) -> float:
+        return self.now
+
+    def sleep(self, seconds: float) -> None:
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+class BaseTest(unittest.TestCase):
+    def setUp(self) -> None:
+        self.fake = FakeClock()
+        self.limiter = ratelimit.RateLimiter(
+            max_wait=60, clock=self.fake.clock, sleep=self.fake.sleep,
+        )
+
+
+class TestParseQuota(unittest.TestCase):
+    def test_parse(self) -> None:
+        self.assertEqual(ratelimit.parse_quota('76'), 76)
+        self.assertEqual(ratelimit.parse_quota('76;w=21600'), 76)
+        self.assertIsNone(ratelimit.parse_quota(''))
+        self.assertIsNone(ratelimit.parse_quota(None))
+        self.assertIsNone(ratelimit.parse_quota('asdf'))
+
+
+class TestAcquire(BaseTest):
+    def test_unknown_host(self) -> None:
+        self.limiter.acquire('api.github.com')
+        self.assertEqual(self.fake.sleeps, [])
+
+    def test_plenty_remaining(self) -> None:
+        self.limiter.update('api.github.com', {
+            'x-ratelimit-limit': '5000',
+            'x-ratelimit-remaining': '4000',
+            'x-ratelimit-reset': '2000',
+        })
+        self.limiter.acquire('api.github.com')
+        self.limiter.acquire('api.github.com')
+        self.assertEqual(self.fake.sleeps, [])
+        self.assertEqual(self.limiter.quotas['api.github.com'].remaining, 3998)
+
+    def test_paces_when_low(self) -> None:
+        self.limiter.update('api.github.com', {
+            'x-ratelimit-limit': '100',
+            'x-ratelimit-remaining': '5',
+            'x-ratelimit-reset': '1050',
+        })
+        self.limiter.acquire('api.github.com')
+        self.limiter.acquire('api.github.com')
+        self.assertEqual(self.fake.sleeps, [10.0])
+
+    def test_waits_for_reset(self) -> None:
+        self.limiter.update('api.github.com', {
+            'x-ratelimit-remaining': '0',
+            'x-ratelimit-reset': '1030',
+        })
+        self.limiter.acquire('api.github.com')
+        self.assertEqual(self.fake.sleeps, [30.0])
+        self.limiter.acquire('api.github.com')
+        self.assertEqual(self.fake.sleeps, [30.0])
+
+    def test_does_not_wait_long(self) -> None:
+        self.limiter.update('api.github.com', {
+            'x-ratelimit-remaining': '0',
+            'x-ratelimit-reset': '5000',
+        })
+        with self.assertRaises(ratelimit.RateLimitError):
+            self.limiter.acquire('api.github.com')
+        self.assertEqual(self.fake.sleeps, [])
+
+    def test_does_not_pace_long(self) -> None:
+        self.limiter.update('api.github.com', {
+            'x-ratelimit-limit': '60',
+            'x-ratelimit-remaining': '5',
+            'x-ratelimit-reset': '4000',
+        })
+        self.limiter.acquire('api.github.com')
+        for _ in range(6):
+            with self.assertRaises(ratelimit.RateLimitError):
+                self.limiter.acquire('api.github.com')
+        self.assertEqual(self.fake.sleeps, [])
+        quota = self.limiter.quotas['api.github.com']
+        self.assertEqual(quota.remaining, 4)
+        self.assertEqual(quota.next_request, 1600.0)
+
+
+class TestRetryDelay(BaseTest):
+    def test_not_rate_limited(self) -> None:
+        self.assertIsNone(self.limiter.retry_delay('hub.docker.com', 404))
+        self.assertIsNone(self.limiter.retry_delay('hub.docker.com', 429))
+
+    def test_retry_after(self) -> None:
+        self.limiter.update('hub.docker.com', {
+            'ratelimit-limit': '100;w=21600',
+            'ratelimit-remaining': '0;w=21600',
+            'retry-after': '20',
+        })
+        self.assertEqual(self.limiter.retry_delay('hub.docker.com', 429), 20)
+
+    def test_too_long(self) -> None:
+        self.limiter.update('api.github.com', {
+            'x-ratelimit-remaining': '0',
+            'x-ratelimit-reset': '5000',
+        })
+        self.assertIsNone(self.limiter.retry_delay('api.github.com', 403))
+
+
+class TestReport(BaseTest):
+    def test_report(self) -> None:
+        self.limiter.update('hub.docker.com', {
+            'ratelimit-limit': '100;w=21600',
+            'ratelimit-remaining': '76;w=21600',
+        })
+        self.assertEqual(
+            self.limiter.report(),
+            ['hub.docker.com: 76 of 100 requests remaining'],
+        )
+
+
+class TestTokenPool(BaseTest):
+    def setUp(self) -> None:
+        super().setUp()
+        self.token_pool = ratelimit.TokenPool(
+            'api.github.com', ['a', 'b'], self.limiter,
+        )
+
+    def test_rotates_unused_tokens(self) -> None:
+        self.assertEqual(
+            self.token_pool.choose(), ('a', 'api.github.com token 1 (core)'),
+        )
+        self.assertEqual(
+            self.token_pool.choose(), ('b', 'api.github.com token 2 (core)'),
+        )
+        self.assertEqual(self.token_pool.requests, [1, 1])
+
+    def test_prefers_remaining_quota(self) -> None:
+        self.limiter.update('api.github.com token 1 (core)', {
+            'x-ratelimit-remaining': '10',
+            'x-ratelimit-reset': '2000',
+        })
+        self.limiter.update('api.github.com token 2 (core)', {
+            'x-ratelimit-remaining': '4000',
+            'x-ratelimit-reset': '2000',
+        })
+        self.assertEqual(self.token_pool.choose()[0], 'b')
+        self.assertEqual(self.token_pool.choose()[0], 'b')
+
+    def test_available(self) -> None:
+        self.assertTrue(self.token_pool.available())
+        for key in ['api.github.com token 1 (core)', 'api.github.com token 2 (core)']:
+            self.limiter.update(key, {
+                'x-ratelimit-remaining': '0',
+                'x-ratelimit-reset': '2000',
+            })
+        self.assertFalse(self.token_pool.available())
+        self.assertTrue(self.limiter.limited('api.github.com token 1 (core)', 403))
+        self.fake.now = 2000
+        self.assertTrue(self.token_pool.available())
+        self.assertFalse(self.limiter.limited('api.github.com token 1 (core)', 403))
+
+    def test_separate_resources(self) -> None:
+        token_pool = ratelimit.TokenPool('api.github.com', ['a'], self.limiter)
+        self.limiter.update('api.github.com token 1 (core)', {
+            'x-ratelimit-remaining': '0',
+            'x-ratelimit-reset': '9000',
+        })
+        self.assertFalse(token_pool.available())
+        self.assertTrue(token_pool.available(ratelimit.GRAPHQL_RESOURCE))
+        _, key = token_pool.choose(ratelimit.GRAPHQL_RESOURCE)
+        self.assertEqual(key, 'api.github.com token 1 (graphql)')
+        self.limiter.acquire(key)
+        self.assertEqual(
+            ratelimit.rate_limit_resource('https://api.github.com/graphql'),
+            ratelimit.GRAPHQL_RESOURCE,
+        )
+        self.assertEqual(
+            ratelimit.rate_limit_resource('https://api.github.com/repos/a/b'),
+            ratelimit.CORE_RESOURCE,
+        )
+
+    def test_report(self) -> None:
+        self.token_pool.choose()
+        self.assertEqual(self.token_pool.report(), [
+            'api.github.com token 1: 1 requests',
+            'api.github.com token 2: 0 requests',
+        ])
@@ -0,0 +1,325 @@
+from __future__ import annotations
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import json
+from pathlib import Path
+import tempfile
+import threading
+import unittest
+from unittest.mock import MagicMock
+
+from req_update import cache, docker, registry, snapshot, util
+
+
+class RegistryHandler(BaseHTTPRequestHandler):
+    """Stand-in OCI registry that requires an anonymous bearer token"""
+    protocol_version = 'HTTP/1.1'
+    tags = ['1.0', '1.1', '1.2', '2.0', 'latest']
+    token_requests: list[str] = []
+    token_response: object = {'token': 'secret'}
+
+    def do_GET(self) -> None:  # NOQA: N802
+        if self.path.startswith('/token?'):
+            RegistryHandler.token_requests.append(self.path)
+            self.send_json(200, self.token_response)
+            return
+        if self.headers.get('Authorization') != 'Bearer secret':
+            realm = 'http://%s/token' % self.headers['Host']
+            self.send_json(401, {'errors': []}, {
+                'WWW-Authenticate': 'Bearer realm="%s",service="test",'
+                    'scope="repository:team/app:pull"' % realm,
+            })
+            return
+        if self.path == '/v2/team/app/tags/list?n=100':
+            self.send_json(200, {'name': 'team/app', 'tags': self.tags[:3]}, {
+                'Link': '</v2/team/app/tags/list?n=100&last=1.2>; rel="next"',
+            })
+            return
+        if self.path == '/v2/team/app/tags/list?n=100&last=1.2':
+            self.send_json(200, {'name': 'team/app', 'tags': self.tags[3:]})
+            return
+        self.send_json(404, {'errors': []})
+
+    def do_HEAD(self) -> None:  # NOQA: N802
+        if self.headers.get('Authorization') != 'Bearer secret':
+            realm = 'http://%s/token' % self.headers['Host']
+            self.send_json(401, None, {
+                'WWW-Authenticate': 'Bearer realm="%s"' % realm,
+            })
+            return
+        tag = self.path.rsplit('/', maxsplit=1)[1]
+        if tag not in self.tags:
+            self.send_json(404, None)
+            return
+        self.send_json(200, None, {'Docker-Content-Digest': 'sha256:' + tag})
+
+    def send_json(
+        self, status: int, data: object, headers: dict[str, str] | None = None,
+    ) -> None:
+        body = json.dumps(data).encode('utf-8') if data is not None else b''
+        self.send_response(status)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format: str, *args: object) -> None:  # NOQA: A002
+        pass
+
+
+class TestTagIndex(unittest.TestCase):
+    def test_contains(self) -> None:
+        index = registry.TagIndex(['3.9', '3.10', '3.9'])
+        self.assertEqual(index.tags, ['3.10', '3.9'])
+        self.assertIn('3.10', index)
+        self.assertNotIn('3.11', index)
+        self.assertNotIn(3, index)
+        self.assertEqual(len(index), 2)
+
+    def test_add(self) -> None:
+        index = registry.TagIndex(['3.9'])
+        index.add(['3.10', '3.9'])
+        self.assertEqual(index.tags, ['3.10', '3.9'])
+
+
+class TestTagNameFilter(unittest.TestCase):
+    def test_filter(self) -> None:
+        self.assertEqual(registry.tag_name_filter('3.9-slim-bookworm'), 'slim-bookworm')
+        self.assertEqual(registry.tag_name_filter('18-alpine3.20'), 'alpine')
+        self.assertEqual(registry.tag_name_filter('10'), '')
+        self.assertEqual(registry.tag_name_filter('v1.2'), '')
+
+
+class TestTagPage(unittest.TestCase):
+    def test_tag_page(self) -> None:
+        page = {
+            'count': 2,
+            'next': 'https://hub.docker.com/next',
+            'results': [{'name': '12', 'images': []}, {'name': '11'}],
+        }
+        self.assertEqual(registry.tag_page(page), {
+            'next': 'https://hub.docker.com/next',
+            'names': ['12', '11'],
+            'count': 2,
+        })
+
+
+class TestDockerHub(unittest.TestCase):
+    def setUp(self) -> None:
+        u = util.Util()
+        self.docker_hub = registry.DockerHub(u)
+        self.mock_request = MagicMock()
+        setattr(u, 'cached_request', self.mock_request)
+        self.tempdir = tempfile.TemporaryDirectory()
+
+    def tearDown(self) -> None:
+        self.tempdir.cleanup()
+
+    def test_tag_url(self) -> None:
+        self.assertEqual(
+            self.docker_hub.tag_url('library', 'debian', '12'),
+            'https://hub.docker.com/v2/repositories/library/debian/tags/12',
+        )
+
+    def test_list_tags(self) -> None:
+        self.mock_request.side_effect = [
+            {'next': 'https://hub.docker.com/page2', 'names': ['12', '11']},
+            {'next': None, 'names': ['10']},
+        ]
+        index = self.docker_hub.list_tags('library', 'debian', 'slim')
+        self.assertEqual(index.tags, ['10', '11', '12'])
+        self.assertTrue(index.complete)
+        url = self.mock_request.call_args_list[0][0][0]
+        self.assertIn(
+            'library/debian/tags?page_size=100&ordering=last_updated&name=slim',
+            url,
+        )
+        self.assertEqual(
+            self.mock_request.call_args_list[1][0][0],
+            'https://hub.docker.com/page2',
+        )
+
+    def test_list_tags_incomplete(self) -> None:
+        self.mock_request.return_value = {
+            'next': 'https://hub.docker.com/next', 'names': ['12'],
+        }
+        index = self.docker_hub.list_tags('library', 'debian')
+        self.assertFalse(index.complete)
+        self.assertEqual(self.mock_request.call_count, registry.MAX_TAG_PAGES)
+
+    def test_too_many_tags(self) -> None:
+        self.mock_request.return_value = {
+            'next': 'https://hub.docker.com/next',
+            'names': ['3.12', '3.11'],
+            'count': registry.MAX_TAG_PAGES * registry.PAGE_SIZE + 1,
+        }
+        index = self.docker_hub.list_tags('library', 'python')
+        self.assertEqual(index.tags, ['3.11', '3.12'])
+        self.assertFalse(index.complete)
+        self.assertEqual(self.mock_request.call_count, 1)
+
+    def test_persists_index(self) -> None:
+        disk_cache = cache.DiskCache(Path(self.tempdir.name))
+        self.docker_hub.util.disk_cache = disk_cache
+        self.mock_request.return_value = {'next': None, 'names': ['12', '11']}
+        self.docker_hub.list_tags('library', 'debian')
+        self.mock_request.reset_mock()
+
+        index = self.docker_hub.list_tags('library', 'debian')
+        self.assertEqual(index.tags, ['11', '12'])
+        self.assertFalse(self.mock_request.called)
+
+    def test_incremental_sync(self) -> None:
+        disk_cache = cache.DiskCache(
+            Path(self.tempdir.name), {'hub.docker.com': -1},
+        )
+        self.docker_hub.util.disk_cache = disk_cache
+        self.mock_request.return_value = {'next': None, 'names': ['12', '11']}
+        self.docker_hub.list_tags('library', 'debian')
+
+        # A later run only has the persisted index
+        self.docker_hub.util.request_cache = cache.MemoryCache()
+        self.mock_request.reset_mock()
+        self.mock_request.return_value = None
+        self.mock_request.side_effect = [
+            {'next': 'https://hub.docker.com/page2', 'names': ['14', '13']},
+            {'next': 'https://hub.docker.com/page3', 'names': ['12', '11']},
+        ]
+        index = self.docker_hub.list_tags('library', 'debian')
+        self.assertEqual(index.tags, ['11', '12', '13', '14'])
+        self.assertTrue(index.complete)
+        self.assertEqual(self.mock_request.call_count, 2)
+
+    def test_offline_snapshot(self) -> None:
+        self.docker_hub.util.snapshot = snapshot.Snapshot()
+        self.mock_request.return_value = {'next': None, 'names': ['12', '11']}
+        self.docker_hub.list_tags('library', 'debian')
+
+        offline = util.Util()
+        offline.snapshot = self.docker_hub.util.snapshot
+        offline.offline = True
+        mock_send_request = MagicMock()
+        setattr(offline, 'send_request', mock_send_request)
+        index = registry.DockerHub(offline).list_tags('library', 'debian')
+        self.assertEqual(index.tags, ['11', '12'])
+        self.assertFalse(mock_send_request.called)
+
+    def test_registers_projection(self) -> None:
+        url = 'https://hub.docker.com/v2/repositories/library/debian/tags?page_size=100'
+        projected = self.docker_hub.util.project(
+            url, {'next': None, 'results': [{'name': '12'}]},
+        )
+        self.assertEqual(projected, {'next': None, 'names': ['12'], 'count': 0})
+
+
+class TestSplitRegistry(unittest.TestCase):
+    def test_docker_hub(self) -> None:
+        self.assertEqual(registry.split_registry('debian'), ('', 'library/debian'))
+        self.assertEqual(
+            registry.split_registry('albertyw/ssh-client'),
+            ('', 'albertyw/ssh-client'),
+        )
+        self.assertEqual(
+            registry.split_registry('docker.io/library/debian'),
+            ('', 'library/debian'),
+        )
+
+    def test_other_registries(self) -> None:
+        self.assertEqual(
+            registry.split_registry('ghcr.io/owner/team/image'),
+            ('ghcr.io', 'owner/team/image'),
+        )
+        self.assertEqual(
+            registry.split_registry('localhost:5000/image'),
+            ('localhost:5000', 'image'),
+        )
+        self.assertEqual(
+            registry.split_registry('localhost/image'), ('localhost', 'image'),
+        )
+
+
+class TestParseChallenge(unittest.TestCase):
+    def test_parse_challenge(self) -> None:
+        scheme, params = registry.parse_challenge(
+            'Bearer realm="https://ghcr.io/token",service="ghcr.io",'
+            'scope="repository:owner/image:pull"',
+        )
+        self.assertEqual(scheme, 'bearer')
+        self.assertEqual(params, {
+            'realm': 'https://ghcr.io/token',
+            'service': 'ghcr.io',
+            'scope': 'repository:owner/image:pull',
+        })
+
+
+class TestOCIRegistry(unittest.TestCase):
+    def setUp(self) -> None:
+        RegistryHandler.token_requests = []
+        RegistryHandler.token_response = {'token': 'secret'}
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), RegistryHandler)
+        self.thread = threading.Thread(
+            target=self.server.serve_forever, args=(0.01,),
+        )
+        self.thread.start()
+        self.host = '127.0.0.1:%d' % self.server.server_address[1]
+        self.util = util.Util()
+        self.registry = registry.OCIRegistry(self.util, self.host)
+
+    def tearDown(self) -> None:
+        self.util.http_pool.close()
+        self.server.shutdown()
+        self.server.server_close()
+        self.thread.join()
+
+    def test_list_tags(self) -> None:
+        index = self.registry.list_tags('team/app')
+        self.assertEqual(index.tags, ['1.0', '1.1', '1.2', '2.0', 'latest'])
+        self.assertTrue(index.complete)
+        self.assertEqual(len(RegistryHandler.token_requests), 1)
+        self.assertIn('service=test', RegistryHandler.token_requests[0])
+        self.assertIn(
+            'scope=repository%3Ateam%2Fapp%3Apull',
+            RegistryHandler.token_requests[0],
+        )
+
+    def test_malformed_token(self) -> None:
+        for token_response in ['not a token', {'expires_in': 300}]:
+            RegistryHandler.token_response = token_response
+            with self.assertRaises(util.HTTPError):
+                self.registry.tag_exists('team/app', 'malformed')
+        updater = docker.Docker(self.util)
+        setattr(self.util, 'warn', MagicMock())
+        version = updater.find_updated_version(self.host + '/team/app', '1.0')
+        self.assertEqual(version, '')
+
+    def test_name_filter(self) -> None:
+        self.assertEqual(self.registry.list_tags('team/app', '.').tags, [
+            '1.0', '1.1', '1.2', '2.0',
+        ])
+        self.assertEqual(self.registry.list_tags('team/app', 'late').tags, ['latest'])
+        self.assertEqual(self.util.request_stats['network_requests'], 4)
+
+    def test_reuses_token(self) -> None:
+        self.registry.list_tags('team/app')
+        other = registry.OCIRegistry(self.util, self.host)
+        self.assertTrue(other.tag_exists('team/app', '1.1'))
+        self.assertFalse(other.tag_exists('team/app', '1.3'))
+        self.assertEqual(len(RegistryHandler.token_requests), 1)
+
+    def test_manifest_digest(self) -> None:
+        self.assertEqual(self.registry.manifest_digest('team/app', '1.1'), 'sha256:1.1')
+        self.assertEqual(self.registry.manifest_digest('team/app', '1.3'), '')
+
+    def test_missing_repository(self) -> None:
+        with self.assertRaises(util.HTTPError) as context:
+            self.registry.list_tags('team/other')
+        self.assertEqual(context.exception.code, 404)
+
+    def test_persists_index(self) -> None:
+        with tempfile.TemporaryDirectory() as directory:
+            self.util.disk_cache = cache.DiskCache(Path(directory))
+            self.registry.list_tags('team/app')
+            other = registry.OCIRegistry(self.util, self.host)
+            index = other.list_tags('team/app')
+        self.assertEqual(len(index), 5)
+        self.assertEqual(self.util.request_stats['network_requests'], 4)
@@ -1,11 +1,13 @@
 from __future__ import annotations
 import argparse
 import io
+import pathlib
 import sys
+import tempfile
 import unittest
 from unittest.mock import MagicMock, patch
 
-from req_update import req_update
+from req_update import req_update, snapshot
 
 
 PIP_OUTDATED = [
@@ -41,6 +43,15 @@ class TestReqUpdateMain(unittest.TestCase):
         self.mock_warn = MagicMock()
         setattr(self.req_update.util, 'warn', self.mock_warn)
 
+    def test_main_exports_snapshot(self) -> None:
+        self.mock_updater.check_applicable.return_value = False
+        self.req_update.util.snapshot = snapshot.Snapshot({'a': 1})
+        with tempfile.TemporaryDirectory() as directory:
+            path = pathlib.Path(directory) / 'snapshot.json'
+            self.req_update.export_snapshot = path
+            self.req_update.main()
+            self.assertEqual(snapshot.Snapshot.load(path).entries, {'a': 1})
+
     def test_main_no_applicable(self) -> None:
         self.mock_updater.check_applicable.return_value = False
         updated = self.req_update.main()
@@ -120,6 +131,95 @@ class TestGetArgs(unittest.TestCase):
         args = self.get_args_with_argv(['-v'])
         self.assertTrue(args.verbose)
 
+    def test_jobs(self) -> None:
+        self.get_args_with_argv(['--jobs', '3'])
+        self.assertEqual(self.req_update.util.jobs, 3)
+        self.get_args_with_argv(['-j', '0'])
+        self.assertEqual(self.req_update.util.jobs, 1)
+
+    def test_cache(self) -> None:
+        self.get_args_with_argv([])
+        self.assertIsNone(self.req_update.util.disk_cache)
+        self.get_args_with_argv([
+            '--cache-dir', '/tmp/req-update',
+            '--cache-ttl', 'hub.docker.com=60',
+            '--cache-max-size', '1000',
+        ])
+        disk_cache = self.req_update.util.disk_cache
+        assert disk_cache is not None
+        self.assertEqual(str(disk_cache.directory), '/tmp/req-update')
+        self.assertEqual(disk_cache.ttls['hub.docker.com'], 60)
+        self.assertEqual(disk_cache.max_size, 1000)
+
+    def test_memory_cache_size(self) -> None:
+        self.get_args_with_argv(['--memory-cache-size', '100'])
+        self.assertEqual(self.req_update.util.request_cache.max_size, 100)
+
+    def test_cache_invalid_ttl(self) -> None:
+        with patch('sys.stderr', new_callable=io.StringIO):
+            with self.assertRaises(SystemExit):
+                self.get_args_with_argv(['--cache-ttl', 'hub.docker.com'])
+
+    def test_mirrors(self) -> None:
+        env = {'REQ_UPDATE_MIRRORS': 'https://a.com=http://m:1, https://b.com=http://m:2'}
+        with patch.dict('os.environ', env):
+            self.get_args_with_argv(['--mirror', 'https://b.com=http://m:3'])
+        self.assertEqual(self.req_update.util.mirrors, {
+            'https://a.com': 'http://m:1',
+            'https://b.com': 'http://m:3',
+        })
+
+    def test_github_token(self) -> None:
+        with patch.dict('os.environ', {'GITHUB_TOKEN': 'token'}):
+            self.get_args_with_argv([])
+        token_pool = self.req_update.util.token_pools['api.github.com']
+        self.assertEqual(token_pool.tokens, ['token'])
+
+    def test_github_tokens(self) -> None:
+        env = {'GITHUB_TOKEN': 'a', 'GITHUB_TOKENS': 'b, a c'}
+        with patch.dict('os.environ', env):
+            self.get_args_with_argv([])
+        token_pool = self.req_update.util.token_pools['api.github.com']
+        self.assertEqual(token_pool.tokens, ['a', 'b', 'c'])
+
+    def test_no_github_tokens(self) -> None:
+        with patch.dict('os.environ', {}, clear=True):
+            self.get_args_with_argv([])
+        self.assertEqual(self.req_update.util.token_pools, {})
+
+    def test_github_tags(self) -> None:
+        self.get_args_with_argv([])
+        self.assertEqual(self.req_update.util.github_tags, 'api')
+        self.get_args_with_argv(['--github-tags', 'git'])
+        self.assertEqual(self.req_update.util.github_tags, 'git')
+
+    def test_invalid_mirror(self) -> None:
+        with patch('sys.stderr', new_callable=io.StringIO):
+            with self.assertRaises(SystemExit):
+                self.get_args_with_argv(['--mirror', 'hub.docker.com=mirror'])
+
+    def test_export_snapshot(self) -> None:
+        self.get_args_with_argv(['--export-snapshot', '/tmp/snapshot.json'])
+        self.assertEqual(
+            str(self.req_update.export_snapshot), '/tmp/snapshot.json',
+        )
+        self.assertIsNotNone(self.req_update.util.snapshot)
+        self.assertFalse(self.req_update.util.offline)
+
+    def test_offline(self) -> None:
+        with tempfile.TemporaryDirectory() as directory:
+            path = pathlib.Path(directory) / 'snapshot.json'
+            snapshot.Snapshot({'a': 1}).save(path)
+            self.get_args_with_argv(['--offline', str(path)])
+        assert self.req_update.util.snapshot is not None
+        self.assertEqual(self.req_update.util.snapshot.entries, {'a': 1})
+        self.assertTrue(self.req_update.util.offline)
+
+    def test_offline_invalid(self) -> None:
+        with patch('sys.stderr', new_callable=io.StringIO):
+            with self.assertRaises(SystemExit):
+                self.get_args_with_argv(['--offline', '/missing/snapshot.json'])
+
     def test_version(self) -> None:
         with patch('sys.stdout', new_callable=io.StringIO) as mock_out:
             with self.assertRaises(SystemExit):
@@ -0,0 +1,41 @@
+from __future__ import annotations
+from pathlib import Path
+import tempfile
+import unittest
+
+from req_update import snapshot
+
+
+class TestSnapshot(unittest.TestCase):
+    def setUp(self) -> None:
+        self.tempdir = tempfile.TemporaryDirectory()
+        self.path = Path(self.tempdir.name) / 'snapshots' / 'snapshot.json'
+
+    def tearDown(self) -> None:
+        self.tempdir.cleanup()
+
+    def test_record(self) -> None:
+        data = snapshot.Snapshot()
+        data.record('a', [1])
+        data.record_missing('b')
+        self.assertEqual(data.entries, {'a': [1]})
+        self.assertEqual(data.missing, {'b'})
+        data.record_missing('a')
+        data.record('b', True)
+        self.assertEqual(data.entries, {'b': True})
+        self.assertEqual(data.missing, {'a'})
+
+    def test_save_load(self) -> None:
+        data = snapshot.Snapshot({'a': {'tags': ['12']}}, ['b'])
+        data.save(self.path)
+        loaded = snapshot.Snapshot.load(self.path)
+        self.assertEqual(loaded.entries, {'a': {'tags': ['12']}})
+        self.assertEqual(loaded.missing, {'b'})
+
+    def test_load_invalid(self) -> None:
+        self.path.parent.mkdir()
+        self.path.write_text('[]')
+        with self.assertRaises(ValueError):
+            snapshot.Snapshot.load(self.path)
+        with self.assertRaises(OSError):
+            snapshot.Snapshot.load(self.path.parent / 'missing.json')
@@ -1,13 +1,18 @@
 from __future__ import annotations
+from concurrent.futures import ThreadPoolExecutor
 import io
 import json
 import os
 from pathlib import Path
 import subprocess
+import tempfile
+import threading
+import time
+from typing import Any
 import unittest
 from unittest.mock import MagicMock, patch
 
-from req_update import util
+from req_update import cache, pool, snapshot, util
 
 
 class TestUpdater(unittest.TestCase):
@@ -71,6 +76,41 @@ class TestCommitGit(unittest.TestCase):
         self.assertTrue(self.mock_execute_shell.called)
         command = self.mock_execute_shell.mock_calls[0][1]
         self.assertIn('commit message', command[0][3])
+        self.assertEqual(command[0][2], '-am')
+
+    def test_commit_staged(self) -> None:
+        self.util.commit_git('commit message', staged=True)
+        command = self.mock_execute_shell.mock_calls[0][1]
+        self.assertEqual(command[0], ['git', 'commit', '-m', 'commit message'])
+
+
+class TestStageFile(unittest.TestCase):
+    def setUp(self) -> None:
+        self.util = util.Util()
+        self.util.dry_run = False
+        self.tempdir = tempfile.TemporaryDirectory()
+        self.path = Path(self.tempdir.name) / 'sub' / 'file'
+        self.path.parent.mkdir()
+        self.path.write_text('old')
+        root = Path(self.tempdir.name)
+        self.util.execute_shell(['git', 'init'], False, cwd=root)
+        self.util.execute_shell(['git', 'add', '.'], False, cwd=root)
+        self.original_cwd = os.getcwd()
+        os.chdir(self.path.parent)
+
+    def tearDown(self) -> None:
+        os.chdir(self.original_cwd)
+        self.tempdir.cleanup()
+
+    def test_stage_file(self) -> None:
+        self.util.stage_file(self.path, 'new')
+        command = ['git', 'show', ':sub/file']
+        self.assertEqual(self.util.execute_shell(command, True).stdout, 'new')
+        self.assertEqual(self.path.read_text(), 'old')
+
+    def test_untracked(self) -> None:
+        with self.assertRaises(RuntimeError):
+            self.util.stage_file(self.path.parent / 'other', 'new')
 
 
 class TestCommitDependencyUpdate(unittest.TestCase):
@@ -378,6 +418,12 @@ class TestExecuteShell(unittest.TestCase):
         result = self.util.execute_shell(command, True, ignore_exit_code=True)
         self.assertIn('ls', result.stderr)
 
+    def test_env(self) -> None:
+        result = self.util.execute_shell(
+            ['sh', '-c', 'echo $REQ_UPDATE_TEST'], True, env={'REQ_UPDATE_TEST': 'a'},
+        )
+        self.assertEqual(result.stdout, 'a\n')
+
     def test_execute_shell(self) -> None:
         command = ['ls']
         path = Path('/')
@@ -467,49 +513,463 @@ class TestLog(unittest.TestCase):
 class TestCachedRequest(unittest.TestCase):
     def setUp(self) -> None:
         self.util = util.Util()
-        self.mock_urlopen = MagicMock()
-        self.original_urlopen = util.urlopen  # type: ignore
-        setattr(util, 'urlopen', self.mock_urlopen)
-
-    def tearDown(self) -> None:
-        setattr(util, 'urlopen', self.original_urlopen)
+        self.mock_request = MagicMock()
+        self.util.http_pool = MagicMock(request=self.mock_request)
 
     def test_cached_request(self) -> None:
         mock_response_content = {'asdf': 'qwer'}
         url = 'https://www.albertyw.com'
-        self.mock_urlopen.return_value = MagicMock(
-            status=200,
-            read=lambda: json.dumps(mock_response_content).encode('utf-8'),
+        self.mock_request.return_value = pool.Response(
+            200, 'OK', {}, json.dumps(mock_response_content).encode('utf-8'),
         )
         result = self.util.cached_request(url, {})
         self.assertEqual(result, mock_response_content)
-        self.mock_urlopen.assert_called_once()
+        self.mock_request.assert_called_once()
         result2 = self.util.cached_request(url, {})
         self.assertEqual(result2, mock_response_content)
-        self.mock_urlopen.assert_called_once()
+        self.mock_request.assert_called_once()
         self.assertEqual(self.util.request_cache[url], mock_response_content)
 
     def test_error(self) -> None:
         url = 'https://www.albertyw.com'
-        self.mock_urlopen.return_value = MagicMock(
-            status=404,
-        )
+        self.mock_request.return_value = pool.Response(404, 'Not Found', {}, b'')
+        with self.assertRaises(util.HTTPError):
+            self.util.cached_request(url, {})
+
+    def test_negative_cache(self) -> None:
+        url = 'https://www.albertyw.com'
+        self.mock_request.return_value = pool.Response(404, 'Not Found', {}, b'')
+        with self.assertRaises(util.HTTPError):
+            self.util.cached_request(url, {})
+        with self.assertRaises(util.HTTPError) as context:
+            self.util.cached_request(url, {})
+        self.assertEqual(context.exception.code, 404)
+        self.mock_request.assert_called_once()
+        self.assertEqual(self.util.request_stats['negative_cache_hits'], 1)
+
+    def test_does_not_cache_other_errors(self) -> None:
+        url = 'https://www.albertyw.com'
+        self.mock_request.return_value = pool.Response(500, 'Error', {}, b'')
         with self.assertRaises(util.HTTPError):
             self.util.cached_request(url, {})
+        with self.assertRaises(util.HTTPError):
+            self.util.cached_request(url, {})
+        self.assertEqual(self.mock_request.call_count, 2)
+
+    def test_negative_disk_cache(self) -> None:
+        url = 'https://www.albertyw.com'
+        self.mock_request.return_value = pool.Response(404, 'Not Found', {}, b'')
+        with tempfile.TemporaryDirectory() as directory:
+            self.util.disk_cache = cache.DiskCache(Path(directory))
+            with self.assertRaises(util.HTTPError):
+                self.util.cached_request(url, {})
+
+            util2 = util.Util()
+            util2.http_pool = self.util.http_pool
+            util2.disk_cache = cache.DiskCache(Path(directory))
+            with self.assertRaises(util.HTTPError):
+                util2.cached_request(url, {})
+            self.mock_request.assert_called_once()
 
     def test_headers(self) -> None:
         mock_response_content = {'asdf': 'qwer'}
         url = 'https://www.albertyw.com'
-        self.mock_urlopen.return_value = MagicMock(
-            status=200,
-            read=lambda: json.dumps(mock_response_content).encode('utf-8'),
+        self.mock_request.return_value = pool.Response(
+            200, 'OK', {}, json.dumps(mock_response_content).encode('utf-8'),
         )
         result = self.util.cached_request(url, {'header': 'value'})
         self.assertEqual(result, mock_response_content)
-        self.mock_urlopen.assert_called_once()
-        self.assertEqual(self.mock_urlopen.call_args[0][0].headers['Header'], 'value')
+        self.mock_request.assert_called_once()
+        self.assertEqual(self.mock_request.call_args[0][0], 'GET')
+        self.assertEqual(self.mock_request.call_args[0][1], url)
+        self.assertEqual(self.mock_request.call_args[0][2]['header'], 'value')
 
         result2 = self.util.cached_request(url, {'header2': 'value2'})
         self.assertEqual(result2, mock_response_content)
-        self.mock_urlopen.assert_called_once()
+        self.mock_request.assert_called_once()
         self.assertEqual(self.util.request_cache[url], mock_response_content)
+
+    def test_disk_cache(self) -> None:
+        mock_response_content = {'asdf': 'qwer'}
+        url = 'https://www.albertyw.com'
+        self.mock_request.return_value = pool.Response(
+            200, 'OK', {}, json.dumps(mock_response_content).encode('utf-8'),
+        )
+        with tempfile.TemporaryDirectory() as directory:
+            self.util.disk_cache = cache.DiskCache(Path(directory))
+            result = self.util.cached_request(url, {})
+            self.assertEqual(result, mock_response_content)
+            self.mock_request.assert_called_once()
+
+            util2 = util.Util()
+            util2.http_pool = self.util.http_pool
+            util2.disk_cache = cache.DiskCache(Path(directory))
+            result2 = util2.cached_request(url, {})
+            self.assertEqual(result2, mock_response_content)
+            self.mock_request.assert_called_once()
+
+    def test_revalidate(self) -> None:
+        mock_response_content = {'asdf': 'qwer'}
+        url = 'https://www.albertyw.com'
+        self.mock_request.return_value = pool.Response(
+            200,
+            'OK',
+            {'ETag': '"abc"', 'Last-Modified': 'yesterday'},
+            json.dumps(mock_response_content).encode('utf-8'),
+        )
+        with tempfile.TemporaryDirectory() as directory:
+            disk_cache = cache.DiskCache(Path(directory), {'www.albertyw.com': -1})
+            self.util.disk_cache = disk_cache
+            self.util.cached_request(url, {})
+            self.mock_request.assert_called_once()
+
+            util2 = util.Util()
+            util2.http_pool = self.util.http_pool
+            util2.disk_cache = disk_cache
+            self.mock_request.return_value = pool.Response(
+                304, 'Not Modified', {}, b'',
+            )
+            result = util2.cached_request(url, {})
+            self.assertEqual(result, mock_response_content)
+            headers = self.mock_request.call_args[0][2]
+            self.assertEqual(headers['If-None-Match'], '"abc"')
+            self.assertEqual(headers['If-Modified-Since'], 'yesterday')
+            self.assertEqual(util2.request_stats['revalidations'], 1)
+
+    def test_coalesces_concurrent_requests(self) -> None:
+        started = threading.Event()
+        release = threading.Event()
+
+        def slow_request(*args: Any) -> pool.Response:
+            started.set()
+            release.wait()
+            return pool.Response(200, 'OK', {}, b'{"asdf": "qwer"}')
+        self.mock_request.side_effect = slow_request
+        url = 'https://www.albertyw.com'
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            first = executor.submit(self.util.cached_request, url, {})
+            started.wait()
+            second = executor.submit(self.util.cached_request, url, {})
+            while not self.util.request_stats['coalesced_requests']:
+                time.sleep(0.001)
+            release.set()
+            self.assertEqual(first.result(), {'asdf': 'qwer'})
+            self.assertEqual(second.result(), {'asdf': 'qwer'})
+        self.mock_request.assert_called_once()
+        self.assertEqual(self.util.inflight_requests, {})
+
+    def test_coalesces_errors(self) -> None:
+        started = threading.Event()
+        release = threading.Event()
+
+        def slow_request(*args: Any) -> pool.Response:
+            started.set()
+            release.wait()
+            return pool.Response(404, 'Not Found', {}, b'')
+        self.mock_request.side_effect = slow_request
+        url = 'https://www.albertyw.com'
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            first = executor.submit(self.util.cached_request, url, {})
+            started.wait()
+            second = executor.submit(self.util.cached_request, url, {})
+            while not self.util.request_stats['coalesced_requests']:
+                time.sleep(0.001)
+            release.set()
+            with self.assertRaises(util.HTTPError):
+                first.result()
+            with self.assertRaises(util.HTTPError):
+                second.result()
+        self.mock_request.assert_called_once()
+        self.assertEqual(self.util.inflight_requests, {})
+
+    def test_projection(self) -> None:
+        self.util.register_projection(r'albertyw\.com', lambda r: r['asdf'])
+        self.mock_request.return_value = pool.Response(
+            200, 'OK', {}, b'{"asdf": "qwer", "zxcv": "uiop"}',
+        )
+        url = 'https://www.albertyw.com'
+        self.assertEqual(self.util.cached_request(url, {}), 'qwer')
+        self.assertEqual(self.util.request_cache[url], 'qwer')
+
+    def test_rate_limit_retry(self) -> None:
+        self.util.rate_limiter.sleep = MagicMock()
+        setattr(self.util, 'warn', MagicMock())
+        self.mock_request.side_effect = [
+            pool.Response(429, 'Too Many Requests', {'Retry-After': '1'}, b''),
+            pool.Response(200, 'OK', {}, b'{}'),
+        ]
+        result = self.util.cached_request('https://www.albertyw.com', {})
+        self.assertEqual(result, {})
+        self.assertEqual(self.mock_request.call_count, 2)
+        self.assertAlmostEqual(
+            self.util.rate_limiter.sleep.call_args[0][0], 1, places=1,
+        )
+
+    def test_rate_limit_exhausted(self) -> None:
+        self.util.rate_limiter.update('www.albertyw.com', {
+            'x-ratelimit-remaining': '0',
+            'x-ratelimit-reset': '9999999999',
+        })
+        with self.assertRaises(util.HTTPError) as context:
+            self.util.cached_request('https://www.albertyw.com', {})
+        self.assertEqual(context.exception.code, 429)
+        self.assertFalse(self.mock_request.called)
+
+    def test_network_error(self) -> None:
+        self.mock_request.side_effect = TimeoutError('timed out')
+        with self.assertRaises(util.HTTPError) as context:
+            self.util.cached_request('https://www.albertyw.com', {})
+        self.assertEqual(context.exception.code, 0)
+        self.assertEqual(self.util.request_stats['network_errors'], 1)
+
+    def test_does_not_modify_headers(self) -> None:
+        self.mock_request.return_value = pool.Response(200, 'OK', {}, b'{}')
+        headers = {'header': 'value'}
+        self.util.cached_request('https://www.albertyw.com', headers)
+        self.assertEqual(headers, {'header': 'value'})
+
+
+class TestCachedPages(unittest.TestCase):
+    def setUp(self) -> None:
+        self.util = util.Util()
+        self.mock_request = MagicMock()
+        self.util.http_pool = MagicMock(request=self.mock_request)
+        self.url = 'https://api.github.com/tags?per_page=2'
+        self.mock_request.side_effect = [
+            pool.Response(200, 'OK', {
+                'Link': '<https://api.github.com/tags?per_page=2&page=2>; '
+                    'rel="next", <https://api.github.com/tags?page=2>; rel="last"',
+            }, b'[1, 2]'),
+            pool.Response(200, 'OK', {}, b'[3]'),
+        ]
+
+    def test_pages(self) -> None:
+        self.assertEqual(list(self.util.cached_pages(self.url, {})), [[1, 2], [3]])
+        self.assertEqual(
+            self.mock_request.call_args[0][1],
+            'https://api.github.com/tags?per_page=2&page=2',
+        )
+        self.assertEqual(list(self.util.cached_pages(self.url, {})), [[1, 2], [3]])
+        self.assertEqual(self.mock_request.call_count, 2)
+
+    def test_stops_early(self) -> None:
+        pages = self.util.cached_pages(self.url, {})
+        self.assertEqual(next(pages), [1, 2])
+        self.mock_request.assert_called_once()
+
+    def test_disk_cache(self) -> None:
+        with tempfile.TemporaryDirectory() as directory:
+            self.util.disk_cache = cache.DiskCache(Path(directory))
+            list(self.util.cached_pages(self.url, {}))
+            util2 = util.Util()
+            util2.http_pool = self.util.http_pool
+            util2.disk_cache = cache.DiskCache(Path(directory))
+            self.assertEqual(list(util2.cached_pages(self.url, {})), [[1, 2], [3]])
+        self.assertEqual(self.mock_request.call_count, 2)
+
+
+class TestNextLink(unittest.TestCase):
+    def test_next_link(self) -> None:
+        self.assertEqual(
+            util.next_link('</v2/a/tags/list?n=100&last=b>; rel="next"'),
+            '/v2/a/tags/list?n=100&last=b',
+        )
+        self.assertIsNone(util.next_link('</a>; rel="prev"'))
+        self.assertIsNone(util.next_link(None))
+
+
+class TestSendRequest(unittest.TestCase):
+    def setUp(self) -> None:
+        self.util = util.Util()
+        self.mock_request = MagicMock()
+        self.util.http_pool = MagicMock(request=self.mock_request)
+        self.util.mirrors = {'https://hub.docker.com': 'http://mirror:8080/hub/'}
+        self.url = 'https://hub.docker.com/v2/repositories/library/debian/tags'
+
+    def test_mirror_url(self) -> None:
+        self.assertEqual(
+            self.util.mirror_url(self.url),
+            'http://mirror:8080/hub/v2/repositories/library/debian/tags',
+        )
+        self.assertEqual(self.util.mirror_url('https://hub.docker.com.evil/v2'), '')
+        self.assertEqual(self.util.mirror_url('https://api.github.com/repos'), '')
+
+    def test_mirror(self) -> None:
+        self.mock_request.return_value = pool.Response(200, 'OK', {}, b'{}')
+        response = self.util.send_request('GET', self.url, {})
+        self.assertEqual(response.status, 200)
+        self.mock_request.assert_called_once()
+        self.assertEqual(
+            self.mock_request.call_args[0][1], self.util.mirror_url(self.url),
+        )
+        self.assertEqual(self.util.request_stats['mirror_fallbacks'], 0)
+
+    def test_mirror_miss(self) -> None:
+        self.mock_request.side_effect = [
+            pool.Response(404, 'Not Found', {}, b''),
+            pool.Response(200, 'OK', {}, b'{}'),
+        ]
+        response = self.util.send_request('GET', self.url, {})
+        self.assertEqual(response.status, 200)
+        self.assertEqual(self.mock_request.call_args[0][1], self.url)
+        self.assertEqual(self.util.request_stats['mirror_fallbacks'], 1)
+
+    def test_mirror_unreachable(self) -> None:
+        self.mock_request.side_effect = [
+            ConnectionRefusedError('refused'),
+            pool.Response(200, 'OK', {}, b'{}'),
+        ]
+        response = self.util.send_request('GET', self.url, {})
+        self.assertEqual(response.status, 200)
+        self.assertEqual(self.mock_request.call_args[0][1], self.url)
+
+    def test_tokens(self) -> None:
+        self.util.set_tokens('api.github.com', ['a', 'b'])
+        self.mock_request.return_value = pool.Response(200, 'OK', {}, b'{}')
+        self.util.send_request('GET', 'https://api.github.com/repos', {})
+        self.assertEqual(
+            self.mock_request.call_args[0][2]['Authorization'], 'Bearer a',
+        )
+        self.util.send_request('GET', self.url, {})
+        self.assertNotIn('Authorization', self.mock_request.call_args[0][2])
+
+    def test_mirror_tokens(self) -> None:
+        self.util.set_tokens('api.github.com', ['a'])
+        self.util.mirrors = {'https://api.github.com': 'http://mirror:8080/github'}
+        self.mock_request.return_value = pool.Response(200, 'OK', {}, b'{}')
+        self.util.send_request('GET', 'https://api.github.com/repos', {})
+        self.assertEqual(
+            self.mock_request.call_args[0][1], 'http://mirror:8080/github/repos',
+        )
+        self.assertEqual(
+            self.mock_request.call_args[0][2]['Authorization'], 'Bearer a',
+        )
+
+    def test_graphql_quota(self) -> None:
+        self.util.set_tokens('api.github.com', ['a'])
+        self.util.rate_limiter.update('api.github.com token 1 (core)', {
+            'x-ratelimit-remaining': '0',
+            'x-ratelimit-reset': '9999999999',
+        })
+        self.mock_request.return_value = pool.Response(200, 'OK', {}, b'{}')
+        response = self.util.send_request(
+            'POST', 'https://api.github.com/graphql', {}, b'{}',
+        )
+        self.assertEqual(response.status, 200)
+        with self.assertRaises(util.HTTPError):
+            self.util.send_request('GET', 'https://api.github.com/repos', {})
+
+    def test_rotates_rate_limited_token(self) -> None:
+        self.util.set_tokens('api.github.com', ['a', 'b'])
+        limited = {'X-RateLimit-Remaining': '0', 'X-RateLimit-Reset': '9999999999'}
+        self.mock_request.side_effect = [
+            pool.Response(403, 'Forbidden', limited, b''),
+            pool.Response(200, 'OK', {'X-RateLimit-Remaining': '4999'}, b'{}'),
+        ]
+        response = self.util.send_request('GET', 'https://api.github.com/repos', {})
+        self.assertEqual(response.status, 200)
+        self.assertEqual(
+            self.mock_request.call_args[0][2]['Authorization'], 'Bearer b',
+        )
+        token_pool = self.util.token_pools['api.github.com']
+        self.assertEqual(token_pool.requests, [1, 1])
+
+
+class TestSnapshot(unittest.TestCase):
+    def setUp(self) -> None:
+        self.util = util.Util()
+        self.mock_request = MagicMock()
+        self.util.http_pool = MagicMock(request=self.mock_request)
+        self.url = 'https://www.albertyw.com'
+
+    def test_records(self) -> None:
+        self.util.snapshot = snapshot.Snapshot()
+        self.mock_request.side_effect = [
+            pool.Response(200, 'OK', {}, b'{"a": 1}'),
+            pool.Response(404, 'Not Found', {}, b''),
+        ]
+        self.util.cached_request(self.url, {})
+        with self.assertRaises(util.HTTPError):
+            self.util.cached_request(self.url + '/missing', {})
+        self.assertEqual(self.util.memoize('key', lambda: [1, 2]), [1, 2])
+        self.assertEqual(self.util.snapshot.entries, {
+            self.url: {'a': 1}, 'key': [1, 2],
+        })
+        self.assertEqual(self.util.snapshot.missing, {self.url + '/missing'})
+
+    def test_offline(self) -> None:
+        self.util.snapshot = snapshot.Snapshot(
+            {self.url: {'a': 1}, 'key': [1]}, [self.url + '/missing'],
+        )
+        self.util.offline = True
+        self.assertEqual(self.util.cached_request(self.url, {}), {'a': 1})
+        self.assertEqual(self.util.memoize('key', lambda: [2]), [1])
+        with self.assertRaises(util.HTTPError) as context:
+            self.util.cached_request(self.url + '/missing', {})
+        self.assertEqual(context.exception.code, 404)
+        with self.assertRaises(util.HTTPError) as context:
+            self.util.cached_request(self.url + '/other', {})
+        self.assertEqual(context.exception.code, 0)
+        with self.assertRaises(util.HTTPError) as context:
+            self.util.send_request('HEAD', self.url, {})
+        self.assertEqual(context.exception.code, 0)
+        self.assertFalse(self.mock_request.called)
+        self.assertEqual(self.util.request_stats['snapshot_hits'], 3)
+
+
+class TestCheckExists(unittest.TestCase):
+    def setUp(self) -> None:
+        self.util = util.Util()
+        self.mock_request = MagicMock()
+        self.util.http_pool = MagicMock(request=self.mock_request)
+        self.url = 'https://www.albertyw.com'
+
+    def test_exists(self) -> None:
+        self.mock_request.return_value = pool.Response(200, 'OK', {}, b'')
+        self.assertTrue(self.util.check_exists(self.url, {}))
+        self.assertTrue(self.util.check_exists(self.url, {}))
+        self.mock_request.assert_called_once()
+        self.assertEqual(self.mock_request.call_args[0][0], 'HEAD')
+
+    def test_missing(self) -> None:
+        self.mock_request.return_value = pool.Response(404, 'Not Found', {}, b'')
+        self.assertFalse(self.util.check_exists(self.url, {}))
+        self.assertFalse(self.util.check_exists(self.url, {}))
+        self.mock_request.assert_called_once()
+
+    def test_error(self) -> None:
+        self.mock_request.return_value = pool.Response(500, 'Error', {}, b'')
+        with self.assertRaises(util.HTTPError):
+            self.util.check_exists(self.url, {})
+
+    def test_head_not_allowed(self) -> None:
+        self.mock_request.side_effect = [
+            pool.Response(405, 'Method Not Allowed', {}, b''),
+            pool.Response(200, 'OK', {}, b'{}'),
+        ]
+        self.assertTrue(self.util.check_exists(self.url, {}))
+        self.assertEqual(self.mock_request.call_args[0][0], 'GET')
+
+    def test_disk_cache(self) -> None:
+        self.mock_request.return_value = pool.Response(404, 'Not Found', {}, b'')
+        with tempfile.TemporaryDirectory() as directory:
+            self.util.disk_cache = cache.DiskCache(Path(directory))
+            self.assertFalse(self.util.check_exists(self.url, {}))
+
+            util2 = util.Util()
+            util2.http_pool = self.util.http_pool
+            util2.disk_cache = cache.DiskCache(Path(directory))
+            self.assertFalse(util2.check_exists(self.url, {}))
+            self.mock_request.assert_called_once()
+
+
+class TestReportRequestStats(unittest.TestCase):
+    def setUp(self) -> None:
+        self.util = util.Util()
+        self.mock_debug = MagicMock()
+        setattr(self.util, 'debug', self.mock_debug)
+
+    def test_report(self) -> None:
+        self.util.request_stats['revalidations'] += 2
+        self.util.report_request_stats()
+        self.assertIn('revalidations=2', self.mock_debug.call_args[0][0])
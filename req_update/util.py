@@ -1,12 +1,26 @@
 from __future__ import annotations
+from collections import Counter
+from concurrent.futures import Future
+from functools import partial
+import http.client
 import json
 import os
 from pathlib import Path
 import re
 import subprocess
-from typing import Any, Optional, Union
-import urllib.error
-from urllib.request import Request, urlopen
+import threading
+from typing import Any, Callable, Iterator, Optional, Union
+from urllib.parse import urljoin, urlsplit
+
+from req_update.cache import DiskCache, MemoryCache
+from req_update.pool import ConnectionPool, Response
+from req_update.ratelimit import (
+    RateLimiter,
+    RateLimitError,
+    TokenPool,
+    rate_limit_resource,
+)
+from req_update.snapshot import Snapshot
 
 
 BRANCH_NAME = 'dep-update'
@@ -16,6 +30,22 @@ SubprocessOutput = Union[
     subprocess.CompletedProcess[str],
 ]
 IGNORE_UPDATE_COMMENT = 'req-update: ignore'
+# Number of concurrent registry lookups
+DEFAULT_JOBS = 8
+# Number of times to send a request that was rate limited
+RATE_LIMIT_ATTEMPTS = 3
+# Environment variable of whitespace or comma separated ORIGIN=MIRROR pairs
+MIRRORS_ENV = 'REQ_UPDATE_MIRRORS'
+# Environment variable of a token for api.github.com
+GITHUB_TOKEN_ENV = 'GITHUB_TOKEN'
+# Environment variable of whitespace or comma separated api.github.com tokens
+GITHUB_TOKENS_ENV = 'GITHUB_TOKENS'
+GITHUB_API_HOST = 'api.github.com'
+# Ways of listing the tags of GitHub Actions
+GITHUB_TAGS_API = 'api'
+GITHUB_TAGS_GIT = 'git'
+# Mirror responses that are retried against the origin, besides 5xx
+MIRROR_MISS_CODES = {404, 429}
 
 
 class Updater:
@@ -50,7 +80,35 @@ class Util:
         self.ignore_cleanliness = True
         self.dry_run = True
         self.branch_exists = False
-        self.request_cache: dict[str, Any] = {}
+        self.jobs = DEFAULT_JOBS
+        self.request_cache = MemoryCache()
+        # Functions that reduce responses to the parts that are used
+        self.projections: dict[str, Callable[[Any], Any]] = {}
+        self.disk_cache: Optional[DiskCache] = None
+        self.request_stats: Counter[str] = Counter()
+        self.request_lock = threading.Lock()
+        self.inflight_requests: dict[str, Future[Any]] = {}
+        # URLs that are known to 404
+        self.missing_urls: set[str] = set()
+        # Updated versions shared by all updaters for the whole run, keyed by
+        # (registry, dependency, current version)
+        self.resolved_versions: dict[tuple[str, str, str], str] = {}
+        # Manifest digests of images, keyed by (image, tag)
+        self.resolved_digests: dict[tuple[str, str], str] = {}
+        self.resolved_versions_lock = threading.Lock()
+        # Bearer tokens for container registries, keyed by (host, scope)
+        self.registry_tokens: dict[tuple[str, str], str] = {}
+        self.http_pool = ConnectionPool()
+        self.rate_limiter = RateLimiter()
+        # Base URLs of mirrors to try before each origin base URL
+        self.mirrors: dict[str, str] = {}
+        # Tokens that authenticate requests, keyed by host
+        self.token_pools: dict[str, TokenPool] = {}
+        # Whether GitHub Actions tags are listed with the API or git ls-remote
+        self.github_tags = GITHUB_TAGS_API
+        # Records registry knowledge, or replaces the network when offline
+        self.snapshot: Optional[Snapshot] = None
+        self.offline = False
 
     def check_repository_cleanliness(self) -> bool:
         """
@@ -71,15 +129,15 @@ class Util:
         lines = [line for line in lines if line and line[:2] != '??']
         return len(lines) == 0
 
-    def commit_git(self, commit_message: str) -> None:
-        """Create a git commit of all changed files"""
+    def commit_git(self, commit_message: str, staged: bool = False) -> None:
+        """Create a git commit of all changed files, or only of staged changes"""
         self.info(commit_message)
-        command = ['git', 'commit', '-am', commit_message]
+        command = ['git', 'commit', '-m' if staged else '-am', commit_message]
         self.execute_shell(command, False)
         self.push_dependency_update()
 
     def commit_dependency_update(
-        self, language: str, dependency: str, version: str,
+        self, language: str, dependency: str, version: str, staged: bool = False,
     ) -> None:
         """Create a commit with a dependency update"""
         commit_message = COMMIT_MESSAGE.format(
@@ -87,7 +145,24 @@ class Util:
             package=dependency,
             version=version,
         )
-        self.commit_git(commit_message)
+        self.commit_git(commit_message, staged=staged)
+
+    def stage_file(self, path: Path, contents: str) -> None:
+        """
+        Stage new contents of a tracked file in the git index without writing
+        them to the working tree
+        """
+        command = ['git', 'ls-files', '--stage', '--full-name', '--', str(path)]
+        entry = self.execute_shell(command, True).stdout
+        if not entry:
+            raise RuntimeError('%s is not tracked by git' % path)
+        mode = entry.split(' ', maxsplit=1)[0]
+        index_path = entry.split('\t', maxsplit=1)[1].strip('\n')
+        command = ['git', 'hash-object', '-w', '--stdin']
+        blob = self.execute_shell(command, False, stdin=contents).stdout.strip()
+        cacheinfo = '%s,%s,%s' % (mode, blob, index_path)
+        command = ['git', 'update-index', '--cacheinfo', cacheinfo]
+        self.execute_shell(command, False)
 
     def create_branch(self) -> None:
         """Create a new branch for committing dependency updates"""
@@ -206,6 +281,8 @@ class Util:
         cwd: Optional[Path] = None,
         suppress_output: bool = False,
         ignore_exit_code: bool = False,
+        stdin: Optional[str] = None,
+        env: Optional[dict[str, str]] = None,
     ) -> SubprocessOutput:
         """Helper method to execute commands in a shell and return output"""
         self.debug(' '.join(command))
@@ -220,6 +297,8 @@ class Util:
                 capture_output=True,
                 check=True,
                 encoding='utf-8',
+                input=stdin,
+                env=dict(os.environ, **env) if env else None,
             )
         except subprocess.CalledProcessError as error:
             if ignore_exit_code:
@@ -257,38 +336,355 @@ class Util:
         """Helper method for taking care of logging statements"""
         print(data)
 
+    def register_projection(
+        self, pattern: str, projection: Callable[[Any], Any],
+    ) -> None:
+        """
+        Register a function that reduces json responses for URLs matching a
+        regex to a compact form.  Only the projected form is cached.
+        """
+        self.projections[pattern] = projection
+
+    def project(self, url: str, result: Any) -> Any:
+        """Apply the first registered projection matching a URL"""
+        for pattern, projection in self.projections.items():
+            if re.search(pattern, url):
+                return projection(result)
+        return result
+
     def cached_request(self, url: str, headers: dict[str, str]) -> Any:
         """
         Makes an HTTP request given a URL and headers, returns the json-parsed result
-        Caches the results based on URL
+        Caches the results based on URL, in memory and optionally on disk.
+        Concurrent requests for the same URL are coalesced into one request.
+        404 responses are also cached and raised again without a request.
         """
-        if url in self.request_cache:
-            return self.request_cache[url]
-        headers['User-Agent'] = 'github.com/albertyw/req-update'
-        request = Request(url, headers=headers)
-        self.debug('Checking %s' % url)
+        return self._single_flight(url, lambda: self._request(url, headers))
+
+    def cached_pages(self, url: str, headers: dict[str, str]) -> Iterator[Any]:
+        """
+        Yield the json-parsed pages of a paginated URL, following rel="next"
+        Link headers.  Each page is cached like cached_request.
+        """
+        page_url: Optional[str] = url
+        while page_url:
+            page = self._single_flight(
+                page_url + '#page', partial(self._request, page_url, headers, True),
+            )
+            yield page['value']
+            page_url = page['next']
+
+    def check_exists(self, url: str, headers: dict[str, str]) -> bool:
+        """
+        Return if a URL exists, using a HEAD request so that no body is
+        downloaded or parsed.  Results are cached like cached_request.
+        Raises HTTPError for responses other than success or 404.
+        """
+        key = url + '#exists'
+        return bool(
+            self._single_flight(key, lambda: self._check_exists(url, key, headers)),
+        )
+
+    def memoize(self, key: str, fetch: Callable[[], Any]) -> Any:
+        """
+        Return a json value derived from registry responses, computed once
+        per run for a key like cached_request and recorded in snapshots.
+        An HTTPError 404 from fetch is also remembered.
+        """
+        return self._single_flight(key, fetch)
+
+    def _single_flight(self, key: str, fetch: Callable[[], Any]) -> Any:
+        """
+        Return the cached result for a key, or call fetch once for the key
+        while concurrent callers wait for and share its result or error
+        """
+        with self.request_lock:
+            if key in self.request_cache:
+                return self.request_cache[key]
+            if key in self.missing_urls:
+                self.request_stats['negative_cache_hits'] += 1
+                raise HTTPError(key, 404, 'Not Found (cached)', None, None)
+            future = self.inflight_requests.get(key)
+            leader = future is None
+            if future is None:
+                future = Future()
+                self.inflight_requests[key] = future
+        if not leader:
+            self.count_request_stat('coalesced_requests')
+            return future.result()
         try:
-            response = urlopen(request)
-        except urllib.error.HTTPError as error:
+            result = self._from_snapshot(key) if self.offline else fetch()
+        except BaseException as error:
+            with self.request_lock:
+                if isinstance(error, HTTPError) and error.code == 404:
+                    self.missing_urls.add(key)
+                    if self.snapshot is not None and not self.offline:
+                        self.snapshot.record_missing(key)
+                del self.inflight_requests[key]
+            future.set_exception(error)
+            raise
+        with self.request_lock:
+            self.request_cache[key] = result
+            del self.inflight_requests[key]
+        if self.snapshot is not None and not self.offline:
+            self.snapshot.record(key, result)
+        future.set_result(result)
+        return result
+
+    def _from_snapshot(self, key: str) -> Any:
+        """Look up a key in the snapshot instead of the network"""
+        snapshot = self.snapshot or Snapshot()
+        with snapshot.lock:
+            found = key in snapshot.entries
+            value = snapshot.entries.get(key)
+            missing = key in snapshot.missing
+        if found:
+            self.count_request_stat('snapshot_hits')
+            return value
+        if missing:
+            self.count_request_stat('snapshot_hits')
+            raise HTTPError(key, 404, 'Not Found (snapshot)', None, None)
+        self.count_request_stat('snapshot_misses')
+        raise HTTPError(key, 0, 'Not in offline snapshot', None, None)
+
+    def _check_exists(self, url: str, key: str, headers: dict[str, str]) -> bool:
+        if self.disk_cache:
+            entry = self.disk_cache.get_entry(key)
+            if entry is not None and self.disk_cache.is_fresh(entry):
+                self.count_request_stat('disk_cache_hits')
+                return not entry.get('missing')
+        self.debug('Checking %s exists' % url)
+        response = self.send_request('HEAD', url, headers)
+        if response.status == 405:
+            # The server does not support HEAD; fall back to a GET
+            try:
+                self.cached_request(url, headers)
+            except HTTPError as error:
+                if error.code != 404:
+                    raise
+                return False
+            return True
+        if response.status != 404 and int(response.status/100) != 2:
             raise HTTPError(
                 url,
-                error.code,
-                error.reason,
-                error.headers,
-                error.fp,
-            ) from error
+                response.status,
+                response.reason,
+                response.headers,
+                None,
+                )
+        exists = response.status != 404
+        if self.disk_cache:
+            if exists:
+                self.disk_cache.set(key, True)
+            else:
+                self.disk_cache.set_missing(key)
+        return exists
+
+    def _request(
+        self, url: str, headers: dict[str, str], paged: bool = False,
+    ) -> Any:
+        """
+        Request a URL, using the disk cache if available.
+        Expired disk cache entries are revalidated with ETag/Last-Modified.
+        Pages are returned with the URL of the next page, like
+        {'value': ..., 'next': ...}.
+        """
+        headers = dict(headers)
+        key = url + '#page' if paged else url
+        stale_entry = None
+        if self.disk_cache:
+            entry = self.disk_cache.get_entry(key)
+            if entry is not None and self.disk_cache.is_fresh(entry):
+                if entry.get('missing'):
+                    self.count_request_stat('negative_cache_hits')
+                    raise HTTPError(url, 404, 'Not Found (cached)', None, None)
+                self.debug('Using cached %s' % url)
+                self.count_request_stat('disk_cache_hits')
+                return entry['value']
+            if entry is not None and not entry.get('missing'):
+                stale_entry = entry
+        if stale_entry is not None:
+            validators = stale_entry.get('validators', {})
+            if 'etag' in validators:
+                headers['If-None-Match'] = validators['etag']
+            if 'last_modified' in validators:
+                headers['If-Modified-Since'] = validators['last_modified']
+        self.debug('Checking %s' % url)
+        response = self.send_request('GET', url, headers)
+        if response.status == 304 and stale_entry is not None:
+            return self._revalidated(key, stale_entry)
+        if response.status == 404 and self.disk_cache:
+            self.disk_cache.set_missing(key)
         if int(response.status/100) != 2:
             raise HTTPError(
                 url,
                 response.status,
-                'Error status',
-                response.getheaders(),
+                response.reason,
+                response.headers,
                 None,
                 )
-        result = json.loads(response.read())
-        self.request_cache[url] = result
+        self.debug(
+            'Fetched %s (%d bytes on wire, %d bytes decoded)'
+            % (url, response.wire_size, len(response.body)),
+        )
+        self.count_request_stat('bytes_on_wire', response.wire_size)
+        self.count_request_stat('bytes_decoded', len(response.body))
+        result = self.project(url, json.loads(response.body))
+        if paged:
+            link = next_link(response.headers.get('link'))
+            result = {'value': result, 'next': urljoin(url, link) if link else None}
+        if self.disk_cache:
+            validators = {}
+            etag = response.headers.get('etag')
+            if etag:
+                validators['etag'] = etag
+            last_modified = response.headers.get('last-modified')
+            if last_modified:
+                validators['last_modified'] = last_modified
+            self.disk_cache.set(key, result, validators)
+        return result
+
+    def send_request(
+        self,
+        method: str,
+        url: str,
+        headers: dict[str, str],
+        body: Optional[bytes] = None,
+    ) -> Response:
+        """
+        Send an HTTP request through the connection pool, pacing requests to
+        stay within each host's rate limit.
+        Requests to a host with tokens are authenticated with the token with
+        the most remaining quota.
+        Requests to an origin with a mirror are sent to the mirror first and
+        only sent to the origin if the mirror fails or does not have the URL.
+        Network errors and timeouts are raised as HTTPError with code 0, as
+        are all requests in offline mode.
+        """
+        if self.offline:
+            self.count_request_stat('snapshot_misses')
+            raise HTTPError(url, 0, 'Offline mode', None, None)
+        # Tokens are chosen by the origin, so mirrors of it are authenticated
+        token_pool = self.token_pools.get(urlsplit(url).hostname or '')
+        resource = rate_limit_resource(url)
+        mirror_url = self.mirror_url(url)
+        if mirror_url:
+            self.count_request_stat('mirror_requests')
+            try:
+                response = self._send_request(
+                    method, mirror_url, headers, body, token_pool, resource,
+                )
+            except HTTPError as error:
+                self.debug('Cannot reach mirror %s: %s' % (mirror_url, error))
+            else:
+                if response.status not in MIRROR_MISS_CODES and (
+                    response.status < 500
+                ):
+                    return response
+                self.debug(
+                    'Mirror returned %d for %s' % (response.status, mirror_url),
+                )
+            self.count_request_stat('mirror_fallbacks')
+        return self._send_request(
+            method, url, headers, body, token_pool, resource,
+        )
+
+    def set_tokens(self, host: str, tokens: list[str]) -> None:
+        """Authenticate requests to a host, rotating across tokens"""
+        if tokens:
+            self.token_pools[host] = TokenPool(host, tokens, self.rate_limiter)
+        else:
+            self.token_pools.pop(host, None)
+
+    def mirror_url(self, url: str) -> str:
+        """Return the URL rewritten to a configured mirror, or an empty string"""
+        for origin, mirror in self.mirrors.items():
+            base = origin.rstrip('/')
+            if url.startswith(base + '/'):
+                return mirror.rstrip('/') + url[len(base):]
+        return ''
+
+    def _send_request(
+        self,
+        method: str,
+        url: str,
+        headers: dict[str, str],
+        body: Optional[bytes],
+        token_pool: Optional[TokenPool],
+        resource: str,
+    ) -> Response:
+        headers = dict(headers)
+        headers['User-Agent'] = 'github.com/albertyw/req-update'
+        host = urlsplit(url).hostname or ''
+        for _ in range(RATE_LIMIT_ATTEMPTS):
+            limit_key = host
+            if token_pool is not None:
+                token, limit_key = token_pool.choose(resource)
+                headers['Authorization'] = 'Bearer %s' % token
+            try:
+                self.rate_limiter.acquire(limit_key)
+            except RateLimitError as error:
+                self.count_request_stat('rate_limited_requests')
+                raise HTTPError(url, 429, str(error), None, None) from error
+            self.count_request_stat('network_requests')
+            try:
+                response = self.http_pool.request(method, url, headers, body)
+            except (OSError, http.client.HTTPException) as error:
+                # Includes timeouts and hosts with an open circuit breaker
+                self.count_request_stat('network_errors')
+                raise HTTPError(url, 0, str(error), None, None) from error
+            self.rate_limiter.update(limit_key, response.headers)
+            if token_pool is not None and token_pool.available(resource) and (
+                self.rate_limiter.limited(limit_key, response.status)
+            ):
+                self.debug('Rate limited on %s, rotating tokens' % limit_key)
+                continue
+            delay = self.rate_limiter.retry_delay(limit_key, response.status)
+            if delay is None:
+                break
+            self.warn(
+                'Rate limited by %s, waiting %d seconds' % (host, delay),
+            )
+            self.rate_limiter.sleep(delay)
+        return response
+
+    def _revalidated(self, url: str, entry: dict[str, Any]) -> Any:
+        """Reuse a cached entry after the server confirmed it is unchanged"""
+        self.debug('Revalidated cached %s' % url)
+        result = entry['value']
+        self.count_request_stat('revalidations')
+        self.count_request_stat('revalidated_bytes', len(json.dumps(result)))
+        if self.disk_cache:
+            self.disk_cache.set(url, result, entry.get('validators'))
         return result
 
+    def count_request_stat(self, name: str, amount: int = 1) -> None:
+        """Thread-safe increment of a request counter"""
+        with self.request_lock:
+            self.request_stats[name] += amount
+
+    def report_request_stats(self) -> None:
+        """Log counters of how registry lookups were served"""
+        self.request_stats['connections_opened'] = (
+            self.http_pool.connections_opened
+        )
+        for name, count in sorted(self.request_stats.items()):
+            self.debug('Request stats: %s=%d' % (name, count))
+        for line in self.rate_limiter.report():
+            self.debug('Rate limit: %s' % line)
+        for token_pool in self.token_pools.values():
+            for line in token_pool.report():
+                self.debug('Token usage: %s' % line)
+
+
+def next_link(value: Optional[str]) -> Optional[str]:
+    """Return the rel="next" URL of a Link header"""
+    for link in (value or '').split(','):
+        match = re.match(r'\s*<([^>]*)>(.*)', link)
+        if match and re.search(r'rel="?next"?', match.group(2)):
+            return match.group(1)
+    return None
+
 
 class HTTPError(RuntimeError):
     """Custom HTTP error to avoid importing urllib.error"""